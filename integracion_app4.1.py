@@ -2,14 +2,32 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import altair as alt
+import pyarrow as pa
 from datetime import datetime, timedelta, date
-import unicodedata
-from difflib import get_close_matches
 import re
+import hashlib
+import logging
+import os
+import stat
+import tempfile
+import time
 from rapidfuzz import process, fuzz
 from pathlib import Path
 from typing import Tuple, Dict
 
+# Copy-on-Write: los slices y rename comparten memoria hasta que se modifican
+pd.options.mode.copy_on_write = True
+
+logger = logging.getLogger(__name__)
+
+# Lector de Excel: calamine (Rust) es varias veces más rápido que openpyxl;
+# si python-calamine no está instalado se usa openpyxl como siempre.
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
+
 
 
 
@@ -32,21 +50,35 @@ def format_money(x):
     except Exception:
         return x
 
-def convert_number(x):
+def style_money(df, cols):
+    """Styler que muestra 'cols' como moneda (igual que format_money) sin alterar los datos."""
+    return df.style.format("${:,.2f}", subset=cols)
+
+def convert_number_series(s):
     """
-    Convierte cadenas con comas o puntos mezclados a float estándar.
-    Ej: '1,234.56' -> 1234.56
-        '1.234,56' -> 1234.56
+    Convierte una Series con cadenas con comas o puntos mezclados a float estándar,
+    con métodos .str vectorizados (no una llamada de Python por celda).
+    Ej: '1.234,56' -> 1234.56
+        '1,234'    -> 1234.0
+    Lo que no se puede convertir queda NaN; una columna ya numérica sólo se pasa a float.
     """
-    s = str(x).strip()
-    if "," in s and "." in s:
-        s = s.replace(".", "").replace(",", ".")
-    else:
-        s = s.replace(",", "")
-    try:
-        return float(s)
-    except:
-        return np.nan
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.astype(np.float64)
+    s = s.astype(str).str.strip()
+    ambos = s.str.contains(",", regex=False) & s.str.contains(".", regex=False)
+    s = s.str.replace(",", "", regex=False).where(
+        ~ambos, s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    )
+    return pd.to_numeric(s, errors="coerce").astype(np.float64)
+
+def ensure_datetime(s):
+    """
+    Devuelve 's' como datetime64. Si Excel ya entregó fechas no se reparsea nada;
+    si vienen como texto se convierten una sola vez por valor distinto (cache=True).
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    return pd.to_datetime(s, errors="coerce", cache=True)
 
 def check_required_columns(df, required_cols, df_name="DataFrame"):
     """
@@ -77,57 +109,221 @@ def style_cumplimiento(val):
     except:
         return ""
 
-def style_difference(val):
+def style_difference(col):
     """
+    Estilo por columna (para Styler.apply), vectorizado con NumPy:
     - Rojo si ≥1.1
     - Amarillo si ≥0.65 y <1.1
+    - Sin estilo si es menor o NaN
     """
-    if pd.isna(val):
-        return ""
-    if val >= 1.1:
-        return "background-color: red; color: white;"
-    elif val >= 0.65:
-        return "background-color: yellow; color: black;"
-    return ""
-
-def normalize_name(s):
-    """Quita tildes, pasa a mayúsculas y colapsa espacios."""
-    s = str(s).strip().upper()
-    # Descompone Unicode y quita marcas diacríticas
-    s = "".join(c for c in unicodedata.normalize("NFKD", s) 
-                if unicodedata.category(c) != "Mn")
-    return " ".join(s.split())
-
-def fuzzy_map(name, choices, cutoff=0.8):
+    v = col.to_numpy(dtype=np.float64)
+    return np.select(
+        [v >= 1.1, v >= 0.65],
+        ["background-color: red; color: white;", "background-color: yellow; color: black;"],
+        default=""
+    )
+
+def style_risk_score(col):
+    """
+    Estilo por columna (para Styler.apply) del score de riesgo, vectorizado:
+    - Verde si <11
+    - Naranja si <35
+    - Rojo en otro caso
+    """
+    v = col.to_numpy(dtype=np.float64)
+    return np.select(
+        [v < 11, v < 35],
+        ["background-color: green; color: white;", "background-color: orange; color: black;"],
+        default="background-color: red; color: white;"
+    )
+
+COLOR_ESTATUS = {"Liquidado": "blue", "Al corriente": "green", "Atrasado": "orange", "Vencido": "red"}
+
+def style_estatus(col):
+    """Estilo por columna (para Styler.apply) del estatus de un crédito: color de texto según COLOR_ESTATUS."""
+    return "color: " + col.astype(str).map(COLOR_ESTATUS) + "; font-weight: bold;"
+
+def normalize_series(s):
+    """
+    Normaliza nombres de una Series para compararlos: quita espacios en los
+    extremos, pasa a mayúsculas, quita tildes (descomposición NFKD y borrado de
+    marcas diacríticas) y colapsa espacios repetidos. Todo con métodos .str.
+    """
+    return (
+        s.astype(str).str.strip().str.upper()
+        .str.normalize("NFKD")
+        .str.replace(r"[\u0300-\u036f]", "", regex=True)   # marcas diacríticas combinantes
+        .str.replace(r"\s+", " ", regex=True).str.strip()
+    )
+
+def fuzzy_map_unique(names, choices, cutoff=0.8, scorer=fuzz.ratio):
     """
-    Devuelve la coincidencia más cercana en 'choices' (lista de strings)
-    si supera 'cutoff'; si no, None.
+    Coincidencia difusa de los valores ÚNICOS de la Series 'names' contra 'choices'
+    (lista de strings) y difunde el resultado a todas sus filas (un promotor aparece
+    en muchas filas). Todas las puntuaciones salen de un solo process.cdist de
+    RapidFuzz (C++); por defecto fuzz.ratio, equivalente al ratio de difflib.
+    Devuelve la mejor opción si supera 'cutoff'; si no, None.
     """
-    matches = get_close_matches(name, choices, n=1, cutoff=cutoff)
-    return matches[0] if matches else None
+    pos, unicos = pd.factorize(names, use_na_sentinel=False)
+    if len(unicos) == 0 or not choices:
+        return pd.Series(None, index=names.index, dtype=object)
+    scores = process.cdist(list(unicos), choices, scorer=scorer, score_cutoff=cutoff * 100)
+    mejor = scores.argmax(axis=1)
+    resultado = np.asarray(choices, dtype=object)[mejor]
+    resultado[scores[np.arange(len(unicos)), mejor] == 0] = None   # nada superó el umbral
+    return pd.Series(resultado[pos], index=names.index)
+
+def map_names_to_codes(nombres, name_to_code, choices):
+    """
+    Código de promotor de cada nombre de la Series 'nombres': exacto por nombre
+    normalizado y, si falla, difuso contra 'choices'. Sólo se trabaja con los
+    nombres ÚNICOS y el resultado se expande una vez a todas las filas, sin
+    columnas temporales ni reasignaciones sobre la Series completa.
+    """
+    pos, unicos = pd.factorize(nombres, use_na_sentinel=False)
+    norm = normalize_series(pd.Series(unicos))
+    codigos = norm.map(name_to_code)
+    sin_codigo = codigos.isna()
+    if sin_codigo.any():
+        codigos[sin_codigo] = fuzzy_map_unique(norm[sin_codigo], choices).map(name_to_code)
+    return pd.Series(codigos.to_numpy()[pos], index=nombres.index)
 
 # --------------------------------------------------------------------
 #                       CARGA DE DATOS (CACHED)
 # --------------------------------------------------------------------
+# Copia en Parquet de los DataFrames ya limpios: leer Excel es lo más lento de
+# la carga, y st.cache_data se pierde al reiniciar el servidor.
+# Contiene datos de clientes y contratos: por defecto va al directorio temporal
+# del sistema (DASHBOARD_CACHE_DIR lo cambia) y los archivos sin usar por más de
+# DASHBOARD_CACHE_DAYS días (7 por defecto) se borran; con 0 no se escribe nada.
+# Sólo se usa si la carpeta es privada del usuario (ver parquet_cache_dir_ok).
+PARQUET_CACHE_DIR = Path(
+    os.environ.get("DASHBOARD_CACHE_DIR") or Path(tempfile.gettempdir()) / "mi-dashboard-cache"
+)
+PARQUET_CACHE_DAYS = float(os.environ.get("DASHBOARD_CACHE_DAYS", "7"))
+# Versión del formato de salida de los loaders: forma parte del nombre del archivo,
+# así un cambio de columnas o dtypes no reutiliza Parquet viejos.
+# SUBIR cada vez que cambie lo que devuelve algún loader.
+CACHE_VERSION = 2
+
+def file_key(archivo):
+    """
+    SHA1 del contenido de un archivo subido, calculado una sola vez por subida
+    (se guarda en session_state por file_id). Los loaders reciben el archivo en
+    un parámetro con '_' (st.cache_data no lo hashea) y esta clave como llave de caché.
+    """
+    if not archivo:
+        return None
+    file_id = getattr(archivo, "file_id", None)
+    claves = st.session_state.setdefault("_file_keys", {})
+    if file_id is None or file_id not in claves:
+        datos = archivo.getvalue() if hasattr(archivo, "getvalue") else Path(archivo).read_bytes()
+        clave = hashlib.sha1(datos).hexdigest()
+        if file_id is None:
+            return clave
+        claves[file_id] = clave
+    return claves[file_id]
+
+def parquet_cache_path(clave, etiqueta):
+    """Ruta Parquet de un archivo de entrada, identificada por su file_key y CACHE_VERSION."""
+    return PARQUET_CACHE_DIR / f"{etiqueta}_v{CACHE_VERSION}_{clave[:16]}.parquet"
+
+def parquet_cache_dir_ok(crear=False):
+    """
+    True si la carpeta de caché es privada: una carpeta real (no enlace simbólico),
+    del usuario del proceso y sin permisos para grupo/otros. Con crear=True la crea
+    (0700) si no existe. Una carpeta ajena o abierta apaga la caché en disco.
+    """
+    try:
+        if crear:
+            PARQUET_CACHE_DIR.mkdir(parents=True, exist_ok=True, mode=0o700)
+        info = os.lstat(PARQUET_CACHE_DIR)
+    except FileNotFoundError:
+        return False
+    if not stat.S_ISDIR(info.st_mode):
+        motivo = "no es una carpeta (¿enlace simbólico?)"
+    elif hasattr(os, "getuid") and info.st_uid != os.getuid():
+        motivo = "pertenece a otro usuario"
+    elif os.name == "posix" and info.st_mode & 0o077:
+        motivo = f"tiene permisos {stat.S_IMODE(info.st_mode):o} (se exige 700)"
+    else:
+        return True
+    logger.warning("Caché Parquet desactivada: %s %s", PARQUET_CACHE_DIR, motivo)
+    return False
+
+def prune_parquet_cache():
+    """Borra los Parquet de otra CACHE_VERSION o sin usar en los últimos PARQUET_CACHE_DAYS días."""
+    limite = time.time() - PARQUET_CACHE_DAYS * 86400
+    for ruta in PARQUET_CACHE_DIR.glob("*.parquet"):
+        try:
+            if f"_v{CACHE_VERSION}_" not in ruta.name or ruta.stat().st_mtime < limite:
+                ruta.unlink()
+        except FileNotFoundError:
+            continue  # otra sesión ya lo borró
+
+def read_parquet_cache(ruta):
+    """Lee un DataFrame guardado con write_parquet_cache (None si no existe o la caché está apagada)."""
+    if PARQUET_CACHE_DAYS <= 0 or not ruta.exists():
+        return None
+    try:
+        if not parquet_cache_dir_ok():
+            return None
+        os.utime(ruta)  # la retención cuenta desde el último uso
+        df = pd.read_parquet(ruta, engine="pyarrow")
+    except (OSError, pa.ArrowException) as exc:
+        # Archivo ilegible o truncado: se reconstruye desde el Excel
+        logger.warning("No se pudo leer la caché Parquet %s: %s", ruta, exc)
+        return None
+    # Parquet no guarda el almacenamiento de las cadenas: se restaura a Arrow
+    return df.astype(dict.fromkeys(df.select_dtypes("string").columns, "string[pyarrow]"))
+
+def write_parquet_cache(df, ruta):
+    """
+    Guarda df en Parquet con permisos 0600 (y de paso poda la caché); si no se
+    puede escribir o la carpeta no es privada, la app sigue sin caché en disco.
+    """
+    if PARQUET_CACHE_DAYS <= 0:
+        return
+    try:
+        if not parquet_cache_dir_ok(crear=True):
+            return
+        prune_parquet_cache()
+        # os.open fija 0600 sin depender del umask; O_NOFOLLOW no sigue enlaces
+        fd = os.open(ruta, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_NOFOLLOW", 0), 0o600)
+        with open(fd, "wb") as f:
+            if hasattr(os, "fchmod"):
+                os.fchmod(fd, 0o600)  # por si el archivo ya existía con otros permisos
+            df.to_parquet(f, engine="pyarrow", compression="zstd")
+    except (OSError, pa.ArrowException) as exc:
+        logger.warning("No se pudo escribir la caché Parquet %s: %s", ruta, exc)
+
 @st.cache_data
 # ==== NUEVA FUNCIÓN PARA EL ARCHIVO Metas_Cobranza.xlsx ======================
 
-def load_data_vastu(vastu_file: Path) -> Tuple[pd.DataFrame,
+def load_data_vastu(_vastu_file: Path, vastu_key: str) -> Tuple[pd.DataFrame,
                                                Dict[str, str],
                                                pd.DataFrame]:
     """
     Lee Metas_Cobranza.xlsx y devuelve:
       df_control, promotores_dict, df_metas_cobranza
     """
+    ruta_control = parquet_cache_path(vastu_key, "control")
+    ruta_metas = parquet_cache_path(vastu_key, "metas")
+    df_control = read_parquet_cache(ruta_control)
+    df_metas_cobranza = read_parquet_cache(ruta_metas)
+    if df_control is not None and df_metas_cobranza is not None:
+        return df_control, dict(zip(df_control["N"], df_control["Nombre"])), df_metas_cobranza
+
     # ---------------------------------------------------------------------
     # -------------------------------------------------------------------------
     # A) LECTURA Y APLANADO DE CABECERAS (filas 4-5-6)
     # -------------------------------------------------------------------------
     df_raw = pd.read_excel(
-        vastu_file,
+        _vastu_file,
         sheet_name="Metas_Cobranza",
         header=[3, 4, 5],           # filas 4-6 (0-index)
-        dtype=str
+        dtype=str,
+        engine=EXCEL_ENGINE
     )
 
     # => Aplana el MultiIndex de columnas:
@@ -231,6 +427,9 @@ def load_data_vastu(vastu_file: Path) -> Tuple[pd.DataFrame,
         [["N", "Nombre", "Antigüedad (meses)", "Cumplimiento"]]
         .sort_values("N")
         .reset_index(drop=True))
+    # Nombres en cadenas respaldadas por Arrow: comparaciones y .str más
+    # rápidas y menos memoria que los objetos de Python.
+    df_control["Nombre"] = df_control["Nombre"].astype("string[pyarrow]")
     # Columna auxiliar en mayúsculas; la usaban rutinas antiguas
     df_control["Nombre_upper"] = df_control["Nombre"].str.upper()
 
@@ -245,34 +444,45 @@ def load_data_vastu(vastu_file: Path) -> Tuple[pd.DataFrame,
     # Columna alias requerida por funciones antiguas
     df_metas_cobranza["Promotor"] = df_metas_cobranza["N"]
 
-
+    write_parquet_cache(df_control, ruta_control)
+    write_parquet_cache(df_metas_cobranza, ruta_metas)
     return df_control, promotores_dict, df_metas_cobranza
 # =============================================================================
 
 
 @st.cache_data
-def load_data_cobranza(cob_file):
+def load_data_cobranza(_cob_file, cob_key):
+    ruta = parquet_cache_path(cob_key, "cobranza")
+    df_cobranza = read_parquet_cache(ruta)
+    if df_cobranza is not None:
+        return df_cobranza
+
     df_cobranza = pd.read_excel(
-        cob_file,
+        _cob_file,
         sheet_name="Recuperaciones",
         skiprows=4,
-        usecols=["Nombre Promotor", "Fecha transacción", "Depósito", "Estado", "Municipio", "Contrato"]
+        usecols=["Nombre Promotor", "Fecha transacción", "Depósito", "Estado", "Municipio", "Contrato"],
+        engine=EXCEL_ENGINE
     )
     required_cols_cob = ["Nombre Promotor", "Fecha transacción", "Depósito", "Estado", "Municipio", "Contrato"  ]
     check_required_columns(df_cobranza, required_cols_cob, "df_cobranza (sheet Recuperaciones)")
 
-    df_cobranza["Fecha transacción"] = pd.to_datetime(df_cobranza["Fecha transacción"], errors="coerce")
-    df_cobranza["Depósito"] = df_cobranza["Depósito"].apply(convert_number)
+    df_cobranza["Fecha transacción"] = ensure_datetime(df_cobranza["Fecha transacción"])
+    df_cobranza["Depósito"] = convert_number_series(df_cobranza["Depósito"])
     df_cobranza.dropna(subset=["Nombre Promotor", "Depósito"], inplace=True)
 
     df_cobranza.rename(columns={"Fecha transacción": "Fecha Transacción"}, inplace=True)
     df_cobranza["Semana"] = df_cobranza["Fecha Transacción"].dt.to_period("W-FRI")
     df_cobranza["Nombre Promotor"] = df_cobranza["Nombre Promotor"].str.strip().str.upper()
-    df_cobranza["Día_num"] = ((df_cobranza["Fecha Transacción"].dt.dayofweek - 5) % 7) + 1
+    # Día 1..7 (sáb-vie); float32 basta (NaN si no hay fecha) y ocupa la mitad.
+    # Aritmética directa sobre el arreglo NumPy, sin Series intermedias.
+    dow = df_cobranza["Fecha Transacción"].dt.dayofweek.to_numpy(dtype=np.float32, na_value=np.nan)
+    df_cobranza["Día_num"] = (dow - 5) % 7 + 1
+    write_parquet_cache(df_cobranza, ruta)
     return df_cobranza
 
 @st.cache_data
-def load_data_colocaciones(col_file):
+def load_data_colocaciones(_col_file, col_key):
     # Columnas que esperamos leer del archivo Excel para diferentes propósitos
     # Asegúrate de que estos nombres coincidan EXACTAMENTE con los de tu archivo Excel (fila 5)
     cols_to_read_from_excel = [
@@ -288,18 +498,29 @@ def load_data_colocaciones(col_file):
     empty_agg = pd.DataFrame(columns=["Nombre promotor", "Semana", "Creditos_Colocados", "Venta"])
     empty_detail = pd.DataFrame(columns=cols_to_read_from_excel)
 
-    if not col_file:
+    if not _col_file:
         # Devuelve DataFrames vacíos con la estructura esperada si no hay archivo
         return empty_agg, empty_detail
 
+    ruta_agg = parquet_cache_path(col_key, "colocaciones_agg")
+    ruta_detalle = parquet_cache_path(col_key, "colocaciones_detalle")
+    df_col_agg = read_parquet_cache(ruta_agg)
+    df_col_detail_return = read_parquet_cache(ruta_detalle)
+    if df_col_agg is not None and df_col_detail_return is not None:
+        return df_col_agg, df_col_detail_return
+
     try:
         df_col_raw = pd.read_excel(
-            col_file,
+            _col_file,
             sheet_name="Colocación", # Nombre de la hoja en tu Excel
             skiprows=4,              # Los encabezados están en la fila 5 (Python cuenta desde 0)
-            header=0                 # La fila después de skiprows es la 0 para pandas
-                                     # No usamos 'usecols' para leer todas las columnas presentes.
-                                     # Así es más flexible si tu Excel tiene más columnas.
+            header=0,                # La fila después de skiprows es la 0 para pandas
+            # Sólo se parsean las columnas que usamos; con un callable las columnas
+            # extra del Excel se ignoran sin error (y las faltantes se reportan abajo)
+            usecols=lambda col: col in cols_to_read_from_excel,
+            # Montos como texto: se limpian las comas una sola vez más abajo
+            dtype={"Monto desembolsado": str, "Cuota total": str},
+            engine=EXCEL_ENGINE
         )
     except Exception as e:
         st.error(f"Error al leer el archivo de Colocaciones (hoja 'Colocación'): {e}")
@@ -309,7 +530,7 @@ def load_data_colocaciones(col_file):
     missing_cols = [col for col in cols_to_read_from_excel if col not in df_col_raw.columns]
     if missing_cols:
         st.error(f"Faltan las siguientes columnas requeridas en la hoja 'Colocación' del archivo de Colocaciones: {', '.join(missing_cols)}")
-        st.warning(f"Columnas encontradas en tu archivo: {', '.join(df_col_raw.columns.tolist())}")
+        st.warning(f"Columnas reconocidas en tu archivo: {', '.join(df_col_raw.columns.tolist())}")
         st.info("Por favor, asegúrate de que los nombres de las columnas en tu archivo Excel (fila 5) coincidan exactamente con los esperados.")
         # Retornamos el df_col_raw para posible inspección si hay error, y un agg vacío.
         return empty_agg, df_col_raw
@@ -319,15 +540,20 @@ def load_data_colocaciones(col_file):
 
     # Limpieza y conversión de tipos para df_col_detail_return
     if "Nombre promotor" in df_col_detail_return.columns:
-        df_col_detail_return["Nombre promotor"] = df_col_detail_return["Nombre promotor"].astype(str).str.strip().str.upper()
+        # Pocos promotores, muchos créditos: 'category' (el mapeo a 'N' se hace por nombre único)
+        df_col_detail_return["Nombre promotor"] = (
+            df_col_detail_return["Nombre promotor"].astype(str).str.strip().str.upper().astype("category")
+        )
+    if "Nombre del cliente" in df_col_detail_return.columns:
+        df_col_detail_return["Nombre del cliente"] = df_col_detail_return["Nombre del cliente"].astype("string[pyarrow]")
     if "Fecha primer pago" in df_col_detail_return.columns:
-        df_col_detail_return["Fecha primer pago"] = pd.to_datetime(df_col_detail_return["Fecha primer pago"], errors='coerce')
+        df_col_detail_return["Fecha primer pago"] = ensure_datetime(df_col_detail_return["Fecha primer pago"])
     if "Cuota total" in df_col_detail_return.columns:
         # Intentamos convertir la "Cuota total" a número, manejando posibles comas como separadores de miles.
         df_col_detail_return["Cuota total"] = df_col_detail_return["Cuota total"].astype(str).str.replace(',', '', regex=False)
         df_col_detail_return["Cuota total"] = pd.to_numeric(df_col_detail_return["Cuota total"], errors='coerce').fillna(0)
     if "Fecha desembolso" in df_col_detail_return.columns: # Necesaria para el detalle también si se usa
-         df_col_detail_return["Fecha desembolso"] = pd.to_datetime(df_col_detail_return["Fecha desembolso"], errors='coerce')
+         df_col_detail_return["Fecha desembolso"] = ensure_datetime(df_col_detail_return["Fecha desembolso"])
     if "Monto desembolsado" in df_col_detail_return.columns: # Necesaria para el detalle también si se usa
          df_col_detail_return["Monto desembolsado"] = pd.to_numeric(df_col_detail_return["Monto desembolsado"].astype(str).str.replace(',', '', regex=False), errors='coerce').fillna(0)
 
@@ -345,7 +571,7 @@ def load_data_colocaciones(col_file):
         # Hacemos una copia para no modificar df_col_raw directamente para la agregación
         df_col_for_aggregation = df_col_raw[required_for_agg].copy()
 
-        df_col_for_aggregation["Fecha desembolso"] = pd.to_datetime(df_col_for_aggregation["Fecha desembolso"], errors='coerce')
+        df_col_for_aggregation["Fecha desembolso"] = ensure_datetime(df_col_for_aggregation["Fecha desembolso"])
         df_col_for_aggregation["Monto desembolsado"] = df_col_for_aggregation["Monto desembolsado"].astype(str).str.replace(',', '', regex=False)
         df_col_for_aggregation["Monto desembolsado"] = pd.to_numeric(df_col_for_aggregation["Monto desembolsado"], errors='coerce')
 
@@ -357,19 +583,23 @@ def load_data_colocaciones(col_file):
             Creditos_Colocados=("Monto desembolsado", "count"),
             Venta=("Monto desembolsado", "sum")
         )
+        # Sólo se guarda en disco una carga completa
+        write_parquet_cache(df_col_agg, ruta_agg)
+        write_parquet_cache(df_col_detail_return, ruta_detalle)
 
     return df_col_agg, df_col_detail_return
 
 # <-- CAMBIO IMPORTANTE: Ajustamos la función para que reciba df_control y mapee el nombre al código
 @st.cache_data
-def load_data_descuentos(por_capturar_file, df_control):
-    if not por_capturar_file:
+def load_data_descuentos(_por_capturar_file, por_capturar_key, df_control):
+    if not _por_capturar_file:
         return pd.DataFrame()
 
     # 1. Leer el Excel
     df_desc = pd.read_excel(
-        por_capturar_file,
-        skiprows=3
+        _por_capturar_file,
+        skiprows=3,
+        engine=EXCEL_ENGINE
     )
 
     # 2. Renombrar columnas alternativas
@@ -377,9 +607,10 @@ def load_data_descuentos(por_capturar_file, df_control):
         "F Desembolso": "Fecha Ministración",
         "Monto": "Descuento Renovación",
     }
-    for antiguo, nuevo in alt_cols.items():
-        if antiguo in df_desc.columns and nuevo not in df_desc.columns:
-            df_desc.rename(columns={antiguo: nuevo}, inplace=True)
+    df_desc = df_desc.rename(columns={
+        antiguo: nuevo for antiguo, nuevo in alt_cols.items()
+        if antiguo in df_desc.columns and nuevo not in df_desc.columns
+    })
 
     # 3. Verificar columnas obligatorias  ### NUEVO: agregar Concepto
     required_cols_desc = [
@@ -395,38 +626,28 @@ def load_data_descuentos(por_capturar_file, df_control):
     df_desc = df_desc[df_desc["Concepto"] == "DESCUENTO POR"]
 
     # 5. Limpieza restante (igual que antes)
-    df_desc["Fecha Ministración"] = pd.to_datetime(
-        df_desc["Fecha Ministración"], errors="coerce"
-    )
-    df_desc["Promotor"] = df_desc["Promotor"].str.strip().str.upper()
-    df_desc["Descuento Renovación"] = df_desc["Descuento Renovación"].apply(convert_number)
+    df_desc["Fecha Ministración"] = ensure_datetime(df_desc["Fecha Ministración"])
+    df_desc["Promotor"] = df_desc["Promotor"].str.strip().str.upper().astype("category")
+    df_desc["Descuento Renovación"] = convert_number_series(df_desc["Descuento Renovación"])
     df_desc.dropna(subset=["Promotor", "Descuento Renovación"], inplace=True)
     df_desc = df_desc[df_desc["Descuento Renovación"] > 0]
 
     # 6. Mapear código promotor
-    name_to_code = dict(zip(df_control["Nombre_upper"], df_control["N"]))
-    df_desc["CodigoPromotor"] = df_desc["Promotor"].map(name_to_code)
+    name_to_code = build_name_maps(df_control)[4]   # NOMBRE en mayúsculas -> N, cacheado
+    # (sobre 'category' el map recorre sólo las categorías; el código queda como texto)
+    df_desc["CodigoPromotor"] = df_desc["Promotor"].map(name_to_code).astype(object)
 
     # --- NUEVO: rescate de nombres que no hicieron match exacto --------------
     if df_desc["CodigoPromotor"].isna().any():
         # Lista de nombres normalizados que sí existen
         choices = list(name_to_code.keys())
 
-        def fuzzy_lookup(nombre):
-            if pd.notna(nombre):
-                mejor, score, _ = process.extractOne(
-                    nombre, choices, scorer=fuzz.WRatio
-                )
-                # Score de 0–100; aceptamos si es ≥ 80
-                if score >= 80:
-                    return name_to_code[mejor]
-            return np.nan
-
-        # Sólo intenta en los que quedaron NaN
+        # Sólo intenta en los que quedaron NaN; score WRatio de 0–100, aceptamos si es ≥ 80
         mask_sin_codigo = df_desc["CodigoPromotor"].isna()
-        df_desc.loc[mask_sin_codigo, "CodigoPromotor"] = (
-            df_desc.loc[mask_sin_codigo, "Promotor"].apply(fuzzy_lookup)
+        mejor = fuzzy_map_unique(
+            df_desc.loc[mask_sin_codigo, "Promotor"], choices, scorer=fuzz.WRatio
         )
+        df_desc.loc[mask_sin_codigo, "CodigoPromotor"] = mejor.map(name_to_code)
     # -------------------------------------------------------------------------
 
 
@@ -452,23 +673,24 @@ def load_data_descuentos(por_capturar_file, df_control):
 
 
 @st.cache_data
-def load_data_pagos(pagos_file):
+def load_data_pagos(_pagos_file, pagos_key):
     """
     Carga el Excel de Pagos Esperados (fila 4 contiene PROMOTOR y SALDO).
     Devuelve un DataFrame con columnas ['PROMOTOR','SALDO'].
     """
-    if not pagos_file:
+    if not _pagos_file:
         return pd.DataFrame(columns=["PROMOTOR","SALDO"])
     df_pagos = pd.read_excel(
-        pagos_file,
+        _pagos_file,
         skiprows=3,                  # saltamos las primeras 3 filas
-        usecols=["PROMOTOR","SALDO","PS*","MULTAS","VENCI*"] # columnas obligatorias
+        usecols=["PROMOTOR","SALDO","PS*","MULTAS","VENCI*"], # columnas obligatorias
+        engine=EXCEL_ENGINE
     )
     required_cols_pagos = ["PROMOTOR","SALDO"]
     check_required_columns(df_pagos, required_cols_pagos, "df_pagos (Pagos Esperados)")
 
-    df_pagos["PROMOTOR"] = df_pagos["PROMOTOR"].str.strip().str.upper()
-    df_pagos["SALDO"]    = df_pagos["SALDO"].apply(convert_number)
+    df_pagos["PROMOTOR"] = df_pagos["PROMOTOR"].str.strip().str.upper().astype("category")
+    df_pagos["SALDO"]    = convert_number_series(df_pagos["SALDO"])
     # --- NUEVO: estandarizamos y transformamos la columna PS* ---------------
     if "PS*" in df_pagos.columns:
         df_pagos.rename(columns={"PS*": "PS"}, inplace=True)     # quitamos el asterisco
@@ -478,13 +700,13 @@ def load_data_pagos(pagos_file):
         # --- NUEVO: columna Saldo Vencido (SV) ----------------------------------
     if "MULTAS" in df_pagos.columns:
         df_pagos.rename(columns={"MULTAS": "SV"}, inplace=True)
-        df_pagos["SV"] = df_pagos["SV"].apply(convert_number).fillna(0)
+        df_pagos["SV"] = convert_number_series(df_pagos["SV"]).fillna(0)
     else:
         df_pagos["SV"] = 0
     # ---- VENCI* → VENCI (fecha de vencimiento) -----------------------------
     if "VENCI*" in df_pagos.columns:
         df_pagos.rename(columns={"VENCI*": "VENCI"}, inplace=True)
-        df_pagos["VENCI"] = pd.to_datetime(df_pagos["VENCI"], errors="coerce")
+        df_pagos["VENCI"] = ensure_datetime(df_pagos["VENCI"])
     else:
         df_pagos["VENCI"] = pd.NaT
 
@@ -500,52 +722,471 @@ def load_data_pagos(pagos_file):
 def merge_colocaciones(df_col_agg, df_control):
     if df_col_agg.empty:
         return pd.DataFrame()
-    # df_control["Nombre_upper"] ya existe y se usa para unificar
+    # df_control["Nombre_upper"] ya existe y se usa para unificar; del control sólo
+    # hace falta el código N (un nombre ⇒ un promotor; si un nombre se repite gana
+    # el último código, igual que en build_name_maps, y main() lo avisa)
     df_col_merge = pd.merge(
         df_col_agg,
-        df_control,
+        df_control[["N", "Nombre_upper"]].drop_duplicates("Nombre_upper", keep="last"),
         left_on="Nombre promotor",
         right_on="Nombre_upper",
-        how="left"
+        how="left",
+        validate="m:1"
     )
     return df_col_merge
 
+@st.cache_data(show_spinner=False)
+def merge_col_desc(df_col_merge, df_desc_agg):
+    """
+    Colocaciones por (N, Semana) con su Descuento_Renovacion (0 si no hubo),
+    unidas una sola vez para todas las vistas por promotor.
+    """
+    if df_col_merge.empty:
+        return df_col_merge
+    if df_desc_agg.empty:
+        return df_col_merge.assign(Descuento_Renovacion=0.0)
+    df_col_desc = pd.merge(
+        df_col_merge,
+        df_desc_agg[["N", "Semana", "Descuento_Renovacion"]],
+        on=["N", "Semana"],
+        how="left",
+        validate="m:1"
+    )
+    df_col_desc["Descuento_Renovacion"] = df_col_desc["Descuento_Renovacion"].fillna(0)
+    return df_col_desc
+
+# Mapeos y lista de códigos: sólo se leen, así que se comparten por referencia
+# (cache_resource) en lugar de des-serializar una copia en cada rerun
+@st.cache_resource(show_spinner=False)
+def build_name_maps(df_control):
+    """
+    Construye una sola vez (por contenido de df_control) los mapeos de promotores:
+      name_to_code  → Nombre normalizado -> código N
+      code_to_name  → código N -> Nombre
+      code_to_name_upper → código N -> NOMBRE (como viene en cobranza)
+      choices       → lista de nombres normalizados (para el fallback difuso)
+      upper_to_code → NOMBRE en mayúsculas -> código N (cruce exacto de los loaders)
+    """
+    nombres_norm = normalize_series(df_control["Nombre"])
+    name_to_code = dict(zip(nombres_norm, df_control["N"]))
+    code_to_name = dict(zip(df_control["N"], df_control["Nombre"]))
+    code_to_name_upper = {code: nombre.upper() for code, nombre in code_to_name.items()}
+    upper_to_code = dict(zip(df_control["Nombre_upper"], df_control["N"]))
+    return name_to_code, code_to_name, code_to_name_upper, nombres_norm.tolist(), upper_to_code
+
+@st.cache_resource(show_spinner=False)
+def sorted_promoter_codes(df_control):
+    """Códigos de promotor únicos en orden numérico (P1, P2, …, P10), una vez por archivo."""
+    return sorted(df_control["N"].unique(), key=lambda x: int(x.lstrip("P")))
+
+@st.cache_data(show_spinner=False)
+def prepare_promoter_codes(df_control, df_metas_summary, df_cobranza, df_pagos_raw):
+    """
+    Asigna el código de promotor 'N' a cobranza y pagos (exacto por nombre normalizado
+    y, si falla, fuzzy) y deja los identificadores como 'category'. Se ejecuta una vez
+    por combinación de archivos, no en cada rerun.
+    Devuelve (df_metas_summary, df_cobranza, df_pagos_raw, df_pagos).
+    """
+    name_to_code, _, _, choices, _ = build_name_maps(df_control)
+
+    # Códigos de promotor como 'category' con las MISMAS categorías en todos
+    # los DataFrames (códigos enteros pequeños → menos memoria, groupby más rápido)
+    codigos_dtype = pd.CategoricalDtype(
+        pd.unique(np.concatenate([
+            df_control["N"].to_numpy(), df_metas_summary["Promotor"].dropna().to_numpy()
+        ]))
+    )
+    df_metas_summary["Promotor"] = df_metas_summary["Promotor"].astype(codigos_dtype)
+    # Nombres y contratos de cobranza también como 'category' (comparaciones y
+    # groupbys por código entero; cada contrato se repite en muchos depósitos)
+    nombres_cob = df_cobranza["Nombre Promotor"].astype("category")
+    df_cobranza["Nombre Promotor"] = nombres_cob
+    df_cobranza["Contrato"] = df_cobranza["Contrato"].astype("category")
+
+    # -------------------------------------------------------------
+    # NORMALIZAMOS NOMBRES en df_cobranza y los convertimos a código
+    # -------------------------------------------------------------
+    # (name_to_code: NOMBRE_NORMALIZADO -> CÓDIGO P1, P2…, con fallback fuzzy;
+    # se resuelve una vez por nombre distinto y se asigna 'N' de una sola vez)
+    df_cobranza["N"] = map_names_to_codes(nombres_cob, name_to_code, choices).astype(codigos_dtype)
+
+    # -------------------------------------------------------------
+    # Pagos Esperados: mismo mapeo (exacto + fuzzy) y total por código
+    # -------------------------------------------------------------
+    df_pagos_raw["N"] = (
+        map_names_to_codes(df_pagos_raw["PROMOTOR"], name_to_code, choices).astype(codigos_dtype)
+    )
+
+    # Sólo la columna SALDO agrupada por N (groupby ya descarta los N nulos),
+    # sin DataFrame intermedio de dropna
+    df_pagos = (
+        df_pagos_raw["SALDO"]
+        .groupby(df_pagos_raw["N"], observed=True)
+        .sum()
+        .reset_index()
+    )
+    return df_metas_summary, df_cobranza, df_pagos_raw, df_pagos
+
+@st.cache_data(show_spinner=False)
+def assign_colocaciones_codes(df_col_details, df_control):
+    """
+    Agrega la columna 'N' al detalle de colocaciones: exacto por nombre en mayúsculas
+    y, si falla, por nombre normalizado. Sólo se mapean los nombres ÚNICOS.
+    """
+    name_to_code, _, _, _, map_nombre_upper_a_N = build_name_maps(df_control)
+    # "Nombre promotor" ya viene en mayúsculas desde load_data_colocaciones
+
+    pos_nombre, nombres_unicos = pd.factorize(df_col_details["Nombre promotor"], use_na_sentinel=False)
+    nombres_unicos = pd.Series(nombres_unicos, dtype=object)
+    codigos_unicos = nombres_unicos.map(map_nombre_upper_a_N)
+
+    # Fallback por si algunos nombres no mapearon directamente
+    sin_codigo = codigos_unicos.isna()
+    if sin_codigo.any():
+        codigos_unicos[sin_codigo] = normalize_series(nombres_unicos[sin_codigo]).map(name_to_code)
+
+    df_col_details["N"] = codigos_unicos.to_numpy()[pos_nombre]
+    return df_col_details
+
 @st.cache_data
 def build_promoters_summary(df_control, df_metas_summary, df_cobranza):
-    promoters_summary_list = []
-    for _, row in df_control.iterrows():
-        code = row["N"]
-        name = row["Nombre"]
-        antig = row["Antigüedad (meses)"]
+    """
+    Total de metas (por código) y de cobranza (por nombre en mayúsculas) de cada
+    promotor del control: dos groupbys sobre todo el DataFrame mapeados a df_control.
+    """
+    metas_por_prom = df_metas_summary.groupby("Promotor", observed=True)["Meta"].sum()
+    cob_por_nombre = (
+        df_cobranza.groupby("Nombre Promotor", observed=True)["Depósito"].sum()
+        if not df_cobranza.empty else pd.Series(dtype=np.float64)
+    )
 
-        df_meta_prom = df_metas_summary[df_metas_summary["Promotor"] == code]
-        total_meta = df_meta_prom["Meta"].sum() if not df_meta_prom.empty else 0
+    df_promoters_summary = pd.DataFrame({
+        "N": df_control["N"].astype(object),
+        "Nombre": df_control["Nombre"].astype(object),
+        "Antigüedad (meses)": df_control["Antigüedad (meses)"],
+        "Total Metas": df_control["N"].map(metas_por_prom).fillna(0),
+        "Total Cobranza": df_control["Nombre_upper"].astype(object).map(cob_por_nombre).fillna(0),
+    })
+    df_promoters_summary["Diferencia"] = (
+        df_promoters_summary["Total Cobranza"] - df_promoters_summary["Total Metas"]
+    )
 
-        if not df_cobranza.empty:
-            total_cob = df_cobranza[df_cobranza["Nombre Promotor"] == name.upper()]["Depósito"].sum()
-        else:
-            total_cob = 0
-        difference = total_cob - total_meta
-
-        if pd.isna(antig) and total_meta == 0 and total_cob == 0:
-            continue
-
-        promoters_summary_list.append({
-            "N": code,
-            "Nombre": name,
-            "Antigüedad (meses)": antig,
-            "Total Metas": total_meta,
-            "Total Cobranza": total_cob,
-            "Diferencia": difference
-        })
-
-    df_promoters_summary = pd.DataFrame(promoters_summary_list)
+    # Fuera los promotores sin antigüedad ni movimientos
+    sin_datos = (
+        df_promoters_summary["Antigüedad (meses)"].isna()
+        & (df_promoters_summary["Total Metas"] == 0)
+        & (df_promoters_summary["Total Cobranza"] == 0)
+    )
+    df_promoters_summary = df_promoters_summary[~sin_datos].reset_index(drop=True)
     df_promoters_summary = df_promoters_summary.sort_values(
         by="N",
         key=lambda x: x.str.extract(r"(\d+)")[0].astype(int)
     )
     return df_promoters_summary
 
+@st.cache_data(show_spinner=False)
+def prepare_cobranza_creditos(df_cobranza):
+    """
+    Cobranza para la pestaña de Créditos a Detalle: encabezados normalizados
+    (minúsculas, sin acentos) y columnas Contrato / Deposito / FechaTrans listas.
+    Se calcula una vez por archivo, no en cada selección de promotor.
+    """
+    columnas = (
+        df_cobranza.columns
+        .str.strip()
+        .str.lower()
+        .str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("utf-8")
+    )
+    df_cob = df_cobranza.set_axis(columnas, axis=1).rename(columns={
+        "contrato": "Contrato",
+        "deposito": "Deposito",
+        "fecha transaccion": "FechaTrans",
+    })
+
+    # El loader ya tipó estas columnas; sólo se reconvierte si llegan como texto
+    if "FechaTrans" in df_cob.columns:
+        df_cob["FechaTrans"] = ensure_datetime(df_cob["FechaTrans"])
+    if "Deposito" in df_cob.columns:
+        if not pd.api.types.is_numeric_dtype(df_cob["Deposito"]):
+            df_cob["Deposito"] = pd.to_numeric(df_cob["Deposito"], errors="coerce")
+        df_cob["Deposito"] = df_cob["Deposito"].fillna(0)
+    else:  # Si Deposito no existe tras renombrar, añadirlo como 0 para evitar errores
+        df_cob["Deposito"] = 0
+    return df_cob
+
+@st.cache_data(show_spinner=False)
+def deposits_by_contract(df_cobranza):
+    """Total depositado por (código de promotor, Contrato), como Series con MultiIndex."""
+    return df_cobranza.groupby(["N", "Contrato"], observed=True, sort=False)["Depósito"].sum()
+
+@st.cache_data(show_spinner=False)
+def compute_tab0_globals(df_metas_summary, df_cobranza, df_col_agg, df_desc_agg, df_pagos_raw):
+    """
+    Agregados de la pestaña "Datos Globales": totales históricos, semanas
+    disponibles y sumas por semana (para la comparación entre dos semanas).
+    Se recalcula sólo cuando cambian los DataFrames de entrada.
+    """
+    total_meta_hist = df_metas_summary["Meta"].sum()
+    total_cob_hist = df_cobranza["Depósito"].sum()
+
+    hist_venta = 0
+    hist_desc = 0
+    total_colocados_hist = 0
+    total_renovados_hist = 0
+    col_wk = pd.DataFrame(columns=["Venta", "Creditos"])
+    desc_wk = pd.DataFrame(columns=["Desc", "Renovados"])
+    if not df_col_agg.empty:
+        hist_venta = df_col_agg["Venta"].sum()
+        total_colocados_hist = df_col_agg["Creditos_Colocados"].sum()
+        col_wk = df_col_agg.groupby("Semana").agg(
+            Venta=("Venta", "sum"),
+            Creditos=("Creditos_Colocados", "sum")
+        )
+    if not df_desc_agg.empty:
+        hist_desc = df_desc_agg["Descuento_Renovacion"].sum()
+        # Conteo de filas => # de créditos renovados aprox.
+        total_renovados_hist = len(df_desc_agg)
+        desc_wk = df_desc_agg.groupby("Semana").agg(
+            Desc=("Descuento_Renovacion", "sum"),
+            Renovados=("Descuento_Renovacion", "size")
+        )
+
+    hist_flujo = hist_venta * 0.9
+    weeks_meta = pd.Index(df_metas_summary["Semana"].unique())
+    weeks_cob = pd.Index(df_cobranza["Semana"].unique())
+
+    return {
+        "total_meta_hist": total_meta_hist,
+        "total_cob_hist": total_cob_hist,
+        "eficiencia_hist": round((total_cob_hist / total_meta_hist) * 100, 2) if total_meta_hist > 0 else 0,
+        "total_cartera_hist": df_pagos_raw["SALDO"].sum(),
+        "hist_venta": hist_venta,
+        "hist_desc": hist_desc,
+        "hist_flujo": hist_flujo,
+        "hist_flujo_final": hist_flujo - hist_desc,
+        "total_colocados_hist": total_colocados_hist,
+        "total_renovados_hist": total_renovados_hist,
+        # Por si acaso, en caso de inconsistencia de datos, nunca negativo
+        "total_nuevos_hist": max(total_colocados_hist - total_renovados_hist, 0),
+        "sorted_weeks": pd.PeriodIndex(weeks_meta.union(weeks_cob), freq="W-FRI").sort_values(),
+        "meta_wk": df_metas_summary.groupby("Semana")["Meta"].sum(),
+        "cob_wk": df_cobranza.groupby("Semana")["Depósito"].sum(),
+        "col_wk": col_wk,
+        "desc_wk": desc_wk,
+    }
+
+@st.cache_data(show_spinner=False)
+def metas_by_promoter_week(df_metas_summary):
+    """Meta por promotor (filas) y semana (columnas) de un solo groupby; NaN si no hubo registro."""
+    return (
+        df_metas_summary.groupby(["Promotor", "Semana"], observed=True)["Meta"].sum()
+        .unstack("Semana")
+    )
+
+@st.cache_data(show_spinner=False)
+def compute_ranking_base(df_metas_summary, df_cobranza):
+    """
+    Dataset base del Ranking: una fila por Promotor-Semana con Meta y Cobranza
+    (0 si faltó meta o cobro esa semana).
+    """
+    # a) Meta y b) Cobranza semanales, ambas indexadas por (Promotor, Semana)
+    metas = df_metas_summary.groupby(["Promotor", "Semana"], observed=True)["Meta"].sum()
+    cobranza = (
+        df_cobranza
+        .groupby(["N", "Semana"], observed=True)["Depósito"]
+        .sum()
+        .rename_axis(["Promotor", "Semana"])
+    )
+
+    # c) Alineación por índice (una sola pasada) → una fila por Promotor-Semana
+    return (
+        pd.concat({"Meta": metas, "Cobranza": cobranza}, axis=1)
+        .fillna(0)        # si faltó meta o cobro esa semana
+        .reset_index()
+    )
+
+@st.cache_data(show_spinner=False)
+def compute_week_tables(df_metas_summary, df_cobranza, selected_week):
+    """
+    Meta y Cobranza por Promotor en la semana seleccionada y acumuladas hasta ella,
+    más los totales de la semana. Reutiliza la base Promotor-Semana del Ranking.
+    """
+    base = compute_ranking_base(df_metas_summary, df_cobranza)
+
+    # a) Semana seleccionada y b) acumulado hasta la semana (inclusive)
+    semana = base[base["Semana"] == selected_week].set_index("Promotor")[["Meta", "Cobranza"]]
+    acum = (
+        base[base["Semana"] <= selected_week]
+        .groupby("Promotor", observed=True)[["Meta", "Cobranza"]]
+        .sum()
+        .rename(columns={"Meta": "MetaAcum", "Cobranza": "CobranzaAcum"})
+    )
+
+    # c) Alineamos todo por código de promotor
+    df_semana = (
+        pd.concat([semana, acum], axis=1)
+        .fillna(0)
+        .rename_axis("Promotor")
+        .reset_index()
+    )
+
+    # d) Diferencias
+    df_semana[["DifSemana", "DifAcum"]] = (
+        df_semana[["Cobranza", "CobranzaAcum"]].to_numpy()
+        - df_semana[["Meta", "MetaAcum"]].to_numpy()
+    )
+
+    # e) Número de promotor (P1, P2…) como entero para ordenar sin parsear texto
+    df_semana["_prom_int"] = df_semana["Promotor"].str.lstrip("P").astype("int32")
+    return df_semana, semana["Meta"].sum(), semana["Cobranza"].sum()
+
+def reindex_weeks(df, start, end, freq="W-FRI", fill=0):
+    """
+    Completa 'df' (una fila por Semana) con TODAS las semanas entre start y end,
+    en orden cronológico; las semanas faltantes se rellenan con 'fill'.
+    """
+    full_weeks = pd.period_range(start=start, end=end, freq=freq)
+    return (
+        df.set_index("Semana")
+        .reindex(full_weeks, fill_value=fill)
+        .rename_axis("Semana")
+        .reset_index()
+    )
+
+@st.cache_data(show_spinner=False)
+def promoter_row_positions(codes):
+    """
+    Posiciones de fila de cada código de promotor (dict código -> np.ndarray),
+    para tomar el subconjunto de un promotor con .iloc en lugar de escanear la columna.
+    """
+    return codes.reset_index(drop=True).groupby(codes.to_numpy(), sort=False).indices
+
+def take_promoter(df, posiciones, code):
+    """Filas de 'df' del promotor 'code' según promoter_row_positions (vacío si no hay)."""
+    return df.iloc[posiciones.get(code, [])]
+
+@st.cache_data(show_spinner=False)
+def compute_pattern_change(df_cobranza, code_to_name, code_to_name_upper):
+    """
+    Variación del día promedio (ponderado por depósito) de pago de cada promotor:
+    compara las primeras y últimas semanas (últimas 6 si hay suficientes).
+    """
+    # Factorizamos promotor (nombre) y semana (orden cronológico); -1 = valor nulo
+    prom_codes, prom_nombres = pd.factorize(df_cobranza["Nombre Promotor"])
+    sem_codes, semanas = pd.factorize(df_cobranza["Semana"], sort=True)
+    validos = (prom_codes >= 0) & (sem_codes >= 0)
+    n_prom, n_sem = len(prom_nombres), len(semanas)
+
+    # Una sola pasada de np.bincount para TODOS los promotores: matrices
+    # [promotor, semana] con Σ(día·depósito), Σ(depósito) y nº de registros
+    celda = prom_codes[validos] * n_sem + sem_codes[validos]
+    dia = df_cobranza["Día_num"].to_numpy(dtype=np.float64)[validos]
+    dep = df_cobranza["Depósito"].to_numpy(dtype=np.float64)[validos]
+    num_all = np.bincount(celda, weights=dia * dep, minlength=n_prom * n_sem).reshape(n_prom, n_sem)
+    den_all = np.bincount(celda, weights=dep, minlength=n_prom * n_sem).reshape(n_prom, n_sem)
+    cnt_all = np.bincount(celda, minlength=n_prom * n_sem).reshape(n_prom, n_sem)
+
+    # Día ponderado por semana = Σ(día·depósito) / Σ(depósito), sólo semanas con
+    # registros; arreglo plano ordenado por promotor y, dentro, por semana
+    presentes = cnt_all > 0
+    fila_cel = np.nonzero(presentes)[0]
+    num, den = num_all[presentes], den_all[presentes]
+    weighted_day = np.divide(num, den, out=np.full(num.shape, np.nan), where=den != 0)
+
+    # Posición de cada semana dentro de su promotor y ventanas a comparar:
+    # con 6 o más semanas, las últimas 6 partidas en mitades de 3; si no, mitades de n // 2
+    n_por_fila = presentes.sum(axis=1)
+    n = n_por_fila[fila_cel]
+    pos = np.arange(fila_cel.size) - (np.cumsum(n_por_fila) - n_por_fila)[fila_cel]
+    half = np.where(n >= 6, 3, n // 2)
+    inicio = np.where(n >= 6, n - 6, 0)
+    en_primeras = (pos >= inicio) & (pos < inicio + half)
+    en_ultimas = pos >= n - half
+
+    def media_por_fila(mascara):
+        """Promedio por promotor de weighted_day[mascara], ignorando NaN (NaN si no hay valores)."""
+        ok = mascara & ~np.isnan(weighted_day)
+        suma = np.bincount(fila_cel[ok], weights=weighted_day[ok], minlength=n_prom)
+        cuenta = np.bincount(fila_cel[ok], minlength=n_prom)
+        return np.divide(suma, cuenta, out=np.full(n_prom, np.nan), where=cuenta > 0)
+
+    first_avg = media_por_fila(en_primeras)
+    last_avg = media_por_fila(en_ultimas)
+
+    # Promotores del control (en su orden) con cobranza en al menos 2 semanas
+    codigos = np.array(list(code_to_name), dtype=object)
+    filas = pd.Index(np.asarray(prom_nombres, dtype=object)).get_indexer(
+        [code_to_name_upper[c] for c in codigos]
+    )
+    con_datos = filas >= 0
+    con_datos[con_datos] = n_por_fila[filas[con_datos]] >= 2
+    filas = filas[con_datos]
+    if filas.size == 0:
+        return pd.DataFrame()
+
+    return pd.DataFrame({
+        "N": codigos[con_datos],
+        "Nombre": [code_to_name[c] for c in codigos[con_datos]],
+        "Inicio Promedio": np.round(first_avg[filas], 2),
+        "Final Promedio": np.round(last_avg[filas], 2),
+        "Diferencia": np.round(last_avg[filas] - first_avg[filas], 2),
+    })
+
+@st.cache_data(show_spinner=False)
+def closed_weeks_compliance(df_metas_summary, df_cobranza, code_to_name_upper, semana_actual, top_weeks=4):
+    """
+    get_recent_weeks_compliance sólo con semanas ya cerradas (anteriores a
+    'semana_actual'). Period contra Period compara los ordinales int64, sin
+    calcular end_time por fila; se recalcula una vez por semana en curso.
+    """
+    df_metas_closed = df_metas_summary.loc[df_metas_summary["Semana"] < semana_actual]
+    df_cobranza_closed = df_cobranza.loc[df_cobranza["Semana"] < semana_actual]
+    return get_recent_weeks_compliance(df_metas_closed, df_cobranza_closed, code_to_name_upper, top_weeks)
+
+def get_recent_weeks_compliance(df_metas, df_cob, code_to_name_upper, top_weeks=4):
+    """
+    % de cumplimiento promedio de las últimas 'top_weeks' semanas de CADA promotor,
+    como Series indexada por código. Las metas se toman por código y la cobranza
+    por nombre en mayúsculas; todo se resuelve con groupbys y np.bincount sobre todo el DataFrame.
+    """
+    metas = df_metas.groupby(["Promotor", "Semana"], sort=False, observed=True)["Meta"].sum()
+
+    # Cobranza por (nombre, semana) → (código, semana)
+    nombres = pd.DataFrame({
+        "Promotor": list(code_to_name_upper.keys()),
+        "Nombre Promotor": list(code_to_name_upper.values()),
+    }).drop_duplicates("Nombre Promotor", keep="last")
+    cob = (
+        df_cob.groupby(["Nombre Promotor", "Semana"], sort=False, observed=True)["Depósito"].sum()
+        .reset_index()
+        .merge(nombres, on="Nombre Promotor", how="inner", validate="m:1")
+        .set_index(["Promotor", "Semana"])["Depósito"]
+    )
+
+    df_weeks = pd.concat({"Meta": metas, "Cobranza": cob}, axis=1).fillna(0)
+    if df_weeks.empty:
+        return pd.Series(dtype=np.float64)
+
+    # Semanas más recientes primero: cada promotor queda en un bloque contiguo
+    df_weeks = df_weeks.sort_index(level=["Promotor", "Semana"], ascending=[True, False])
+
+    # Cumplimiento = Cobranza/Meta*100 (0 si no hubo meta), sin apply fila por fila
+    meta = df_weeks["Meta"].to_numpy(dtype=np.float64)
+    cob_sem = df_weeks["Cobranza"].to_numpy(dtype=np.float64)
+    cumplimiento = np.divide(cob_sem, meta, out=np.zeros_like(cob_sem), where=meta > 0) * 100
+
+    # Una sola pasada plana: posición de cada fila dentro de su bloque (0 = semana más
+    # reciente), nos quedamos con las primeras 'top_weeks' y promediamos con np.bincount
+    prom_codes, promotores = pd.factorize(df_weeks.index.get_level_values("Promotor"))
+    inicio_bloque = np.flatnonzero(np.r_[True, prom_codes[1:] != prom_codes[:-1]])
+    largo_bloque = np.diff(np.r_[inicio_bloque, prom_codes.size])
+    posicion = np.arange(prom_codes.size) - np.repeat(inicio_bloque, largo_bloque)
+    recientes = posicion < top_weeks
+
+    suma = np.bincount(prom_codes[recientes], weights=cumplimiento[recientes], minlength=len(promotores))
+    n_sem = np.bincount(prom_codes[recientes], minlength=len(promotores))
+    return pd.Series(suma / n_sem, index=pd.Index(promotores, name="Promotor")).round(2)
+
 def main():
     st.sidebar.title("Parámetros y Archivos")
     # ——————————————————————————————
@@ -574,29 +1215,35 @@ def main():
 
     if vas_file and cob_file:
         try:
-            df_control, promotores_dict, df_metas_summary = load_data_vastu(vas_file)
-            df_cobranza = load_data_cobranza(cob_file)
-            # -------------------------------------------------------------
-            # NORMALIZAMOS NOMBRES en df_cobranza y los convertimos a código
-            # -------------------------------------------------------------
-            df_cobranza["Nombre_norm"] = df_cobranza["Nombre Promotor"].apply(normalize_name)
-
-            # Diccionario NOMBRE_NORMALIZADO  ->  CÓDIGO  (P1, P2…)
-            name_to_code = dict(zip(df_control["Nombre"].apply(normalize_name), df_control["N"]))
-
-            # Asignamos código
-            df_cobranza["N"] = df_cobranza["Nombre_norm"].map(name_to_code)
-
-            # Fallback fuzzy: intentamos empatar lo que quedó sin código
-            unmapped = df_cobranza["N"].isna()
-            choices  = list(name_to_code.keys())
-            df_cobranza.loc[unmapped, "Nombre_norm"] = df_cobranza.loc[unmapped, "Nombre_norm"].apply(
-                lambda nm: fuzzy_map(nm, choices)
+            df_control, promotores_dict, df_metas_summary = load_data_vastu(vas_file, file_key(vas_file))
+
+            # Nombres repetidos en el control: los cruces por nombre no pueden distinguirlos
+            nombres_dup = df_control.loc[df_control["Nombre_upper"].duplicated(keep=False), ["Nombre_upper", "N"]]
+            if not nombres_dup.empty:
+                detalle = "; ".join(
+                    f"{nombre} ({', '.join(codigos.astype(str))})"
+                    for nombre, codigos in nombres_dup.groupby("Nombre_upper", sort=False)["N"]
+                )
+                st.warning(
+                    f"Hay promotores con el mismo nombre en el archivo de metas: {detalle}. "
+                    "En cobranza, colocaciones y pagos (que se cruzan por nombre) sólo se usa "
+                    "el último código de cada nombre; corrige el archivo de control."
+                )
+            df_cobranza = load_data_cobranza(cob_file, file_key(cob_file))
+
+            df_pagos_raw = load_data_pagos(pagos_file, file_key(pagos_file))
+
+            # Mapeos N -> Nombre (tal cual y en mayúsculas), cacheados
+            _, code_to_name, code_to_name_upper, _, _ = build_name_maps(df_control)
+            codes_sorted = sorted_promoter_codes(df_control)
+
+            # Códigos de promotor (exacto + fuzzy) y tipos 'category': una vez por archivo
+            df_metas_summary, df_cobranza, df_pagos_raw, df_pagos = prepare_promoter_codes(
+                df_control, df_metas_summary, df_cobranza, df_pagos_raw
             )
-            df_cobranza["N"] = df_cobranza["Nombre_norm"].map(name_to_code)
 
                         # --- MODIFICADO: Carga de datos de colocaciones (agregado y detallado) ---
-            df_col_agg, df_colocaciones_raw_details = load_data_colocaciones(col_file)
+            df_col_agg, df_colocaciones_raw_details = load_data_colocaciones(col_file, file_key(col_file))
 
             # --- NUEVO: Inicializar df_colocaciones_info_completa ---
             # Esto asegura que la variable siempre exista, incluso si no se carga el archivo col_file
@@ -607,21 +1254,10 @@ def main():
             if not df_colocaciones_raw_details.empty:
                 # Asegurar que la columna "Nombre promotor" exista en los detalles crudos
                 if "Nombre promotor" in df_colocaciones_raw_details.columns:
-                    # df_control ya tiene "Nombre_upper" y "N" de load_data_control
-                    # "Nombre promotor" en df_colocaciones_raw_details ya se pasó a upper en load_data_colocaciones
-                    map_nombre_upper_a_N = dict(zip(df_control["Nombre_upper"], df_control["N"]))
-
-                    df_colocaciones_raw_details["N"] = df_colocaciones_raw_details["Nombre promotor"].map(map_nombre_upper_a_N)
-
-                    # Fallback por si algunos nombres no mapearon directamente
-                    unmapped_col_indices = df_colocaciones_raw_details["N"].isna()
-                    if unmapped_col_indices.any():
-                        # Preparamos un diccionario para mapeo normalizado
-                        control_norm_to_N_map = dict(zip(df_control["Nombre"].apply(normalize_name), df_control["N"]))
-
-                        # Aplicamos normalize_name a los nombres de promotor no mapeados e intentamos mapear de nuevo
-                        nombres_no_mapeados_normalizados = df_colocaciones_raw_details.loc[unmapped_col_indices, "Nombre promotor"].apply(normalize_name)
-                        df_colocaciones_raw_details.loc[unmapped_col_indices, "N"] = nombres_no_mapeados_normalizados.map(control_norm_to_N_map)
+                    # Código 'N' por nombre (cacheado por archivo)
+                    df_colocaciones_raw_details = assign_colocaciones_codes(
+                        df_colocaciones_raw_details, df_control
+                    )
 
                     # Si después del fallback aún hay Nulos en 'N', avisamos…
                     if df_colocaciones_raw_details["N"].isna().any():
@@ -642,43 +1278,16 @@ def main():
                             )
 
 
-                    df_colocaciones_info_completa = df_colocaciones_raw_details.copy()
+                    # Sin copia: la pestaña 6 sólo lee (y filtra) este DataFrame
+                    df_colocaciones_info_completa = df_colocaciones_raw_details
                 else:
                     st.error("La columna 'Nombre promotor' es necesaria en tu archivo 'Colocaciones.xlsx' (hoja 'Colocación', fila 5) para la pestaña 'Créditos a Detalle'.")
                     # df_colocaciones_info_completa seguirá vacío, la pestaña mostrará un error controlado.
 
             df_col_merge = merge_colocaciones(df_col_agg, df_control)
             # <-- CAMBIO: pasamos df_control a load_data_descuentos
-            df_desc_agg = load_data_descuentos(por_capturar_file, df_control)
-                # Cargamos los Pagos Esperados
-            df_pagos_raw = load_data_pagos(pagos_file)
-
-            # 1) Normalizamos nombres en df_control y en df_pagos_raw
-            df_control["Nombre_norm"]      = df_control["Nombre"].apply(normalize_name)
-            df_pagos_raw["PROMOTOR_norm"]  = df_pagos_raw["PROMOTOR"].apply(normalize_name)
-
-            # 2) Mapeo exacto con el diccionario Nombre_norm -> N
-            name_to_code = dict(zip(df_control["Nombre_norm"], df_control["N"]))
-            df_pagos_raw["N"] = df_pagos_raw["PROMOTOR_norm"].map(name_to_code)
-
-            # 3) Fallback difuso para los no mapeados
-            unmapped = df_pagos_raw["N"].isna()
-            choices = df_control["Nombre_norm"].tolist()
-            df_pagos_raw.loc[unmapped, "PROMOTOR_norm"] = (
-                df_pagos_raw.loc[unmapped, "PROMOTOR_norm"]
-                .apply(lambda nm: fuzzy_map(nm, choices))
-            )
-            # Remapeamos tras el fallback
-            df_pagos_raw["N"] = df_pagos_raw["PROMOTOR_norm"].map(name_to_code)
-
-            # 4) Agrupamos finalmente por código
-            df_pagos = (
-                df_pagos_raw
-                .dropna(subset=["N"])
-                .groupby("N", as_index=False)["SALDO"]
-                .sum()
-            )
-
+            df_desc_agg = load_data_descuentos(por_capturar_file, file_key(por_capturar_file), df_control)
+            df_col_desc = merge_col_desc(df_col_merge, df_desc_agg)
 
             df_promoters_summary = build_promoters_summary(df_control, df_metas_summary, df_cobranza)
         except Exception as e:
@@ -714,37 +1323,26 @@ def main():
                 # 1) Totales Históricos de Metas y Cobranza (y eficiencia)
                 # --------------------------------------------------------------------
                 # 1) Totales Históricos de Metas, Cobranza, Eficiencia y Cartera
-                total_meta_hist    = df_metas_summary["Meta"].sum()
-                total_cob_hist     = df_cobranza["Depósito"].sum()
-                eficiencia_hist    = round((total_cob_hist / total_meta_hist) * 100, 2) if total_meta_hist>0 else 0
-                total_cartera_hist = df_pagos_raw["SALDO"].sum()    # <-- calculamos la cartera total
+                # (todos los agregados de la pestaña se calculan en compute_tab0_globals, cacheada)
+                totales = compute_tab0_globals(df_metas_summary, df_cobranza, df_col_agg,
+                                               df_desc_agg, df_pagos_raw)
 
                 colH_m1, colH_m2, colH_m3, colH_m4 = st.columns(4)
-                colH_m1.metric("Total Metas (Histórico)",      format_money(total_meta_hist))
-                colH_m2.metric("Total Cobranza (Histórico)",   format_money(total_cob_hist))
-                colH_m3.metric("Eficiencia (Histórico)",       f"{eficiencia_hist}%")
-                colH_m4.metric("Valor Total de Cartera",       format_money(total_cartera_hist))  # <--- nuevo
+                colH_m1.metric("Total Metas (Histórico)",      format_money(totales["total_meta_hist"]))
+                colH_m2.metric("Total Cobranza (Histórico)",   format_money(totales["total_cob_hist"]))
+                colH_m3.metric("Eficiencia (Histórico)",       f"{totales['eficiencia_hist']}%")
+                colH_m4.metric("Valor Total de Cartera",       format_money(totales["total_cartera_hist"]))  # <--- nuevo
 
 
                 # --------------------------------------------------------------------
                 # 2) Totales Históricos de Venta, Flujo, Desc. Renov. y Flujo Final
                 # --------------------------------------------------------------------
-                hist_venta = 0
-                hist_desc = 0
-                if not df_col_agg.empty:
-                    hist_venta = df_col_agg["Venta"].sum()
-                if not df_desc_agg.empty:
-                    hist_desc = df_desc_agg["Descuento_Renovacion"].sum()
-
-                hist_flujo = hist_venta * 0.9
-                hist_flujo_final = hist_flujo - hist_desc
-
                 st.markdown("#### Totales Históricos de Venta y Flujo")
                 colH1, colH2, colH3, colH4 = st.columns(4)
-                colH1.metric("Venta (Hist)", format_money(hist_venta))
-                colH2.metric("Flujo (Hist)", format_money(hist_flujo))
-                colH3.metric("Desc. Renov. (Hist)", format_money(hist_desc))
-                colH4.metric("Flujo Final (Hist)", format_money(hist_flujo_final))
+                colH1.metric("Venta (Hist)", format_money(totales["hist_venta"]))
+                colH2.metric("Flujo (Hist)", format_money(totales["hist_flujo"]))
+                colH3.metric("Desc. Renov. (Hist)", format_money(totales["hist_desc"]))
+                colH4.metric("Flujo Final (Hist)", format_money(totales["hist_flujo_final"]))
 
                 # --------------------------------------------------------------------
                 # 3) Gráfica de 3 Barras: 
@@ -752,24 +1350,12 @@ def main():
                 #    - Créditos Nuevos
                 #    - Créditos Renovados
                 # --------------------------------------------------------------------
-                total_colocados_hist = 0
-                if not df_col_agg.empty:
-                    total_colocados_hist = df_col_agg["Creditos_Colocados"].sum()
-
-                # Usamos df_desc_agg para estimar cuántos créditos se renovaron (contando filas)
-                # ya que antes, para cada semana, usábamos len(...) como aproximación de créditos renovados.
-                total_renovados_hist = 0
-                if not df_desc_agg.empty:
-                    total_renovados_hist = len(df_desc_agg)  # Conteo de filas => # de créditos renovados aprox.
-
-                total_nuevos_hist = total_colocados_hist - total_renovados_hist
-                if total_nuevos_hist < 0:
-                    # Por si acaso, en caso de inconsistencia de datos
-                    total_nuevos_hist = 0
-
-                df_credits_hist = pd.DataFrame({
+                # Tabla Arrow mínima para la gráfica (sin pasar por un DataFrame de pandas)
+                df_credits_hist = pa.table({
                     "Tipo": ["Total Colocados", "Nuevos", "Renovados"],
-                    "Cantidad": [total_colocados_hist, total_nuevos_hist, total_renovados_hist]
+                    "Cantidad": [int(totales["total_colocados_hist"]),
+                                 int(totales["total_nuevos_hist"]),
+                                 int(totales["total_renovados_hist"])]
                 })
 
                 st.markdown("#### Total de Créditos Colocados (Hist), Nuevos y Renovados")
@@ -784,20 +1370,15 @@ def main():
                 # 4) COMPARACIÓN ENTRE DOS SEMANAS (sección anterior, intacta)
                 # --------------------------------------------------------------------
                 st.markdown("### Comparación entre dos Semanas")
-                weeks_meta = pd.Index(df_metas_summary["Semana"].unique())
-                weeks_cob = pd.Index(df_cobranza["Semana"].unique())
-                all_weeks = weeks_meta.union(weeks_cob)
+                sorted_weeks = totales["sorted_weeks"]
 
-                if len(all_weeks) == 0:
+                if len(sorted_weeks) == 0:
                     st.write("No se encontraron semanas disponibles.")
                 else:
-                    # Generar etiquetas
-                    sorted_weeks = sorted(all_weeks, key=lambda p: p.start_time)
+                    # Generar etiquetas (lunes de cada semana, en una sola operación vectorizada)
+                    labels = (sorted_weeks.start_time + pd.Timedelta(days=2)).strftime("%-d %b %Y")
 
-                    def format_week_label(w):
-                        return (w.start_time + pd.Timedelta(days=2)).strftime("%-d %b %Y")
-
-                    week_mapping = {format_week_label(w): w for w in sorted_weeks}
+                    week_mapping = dict(zip(labels, sorted_weeks))
                     week_labels = list(week_mapping.keys())
 
                     st.markdown("#### Selecciona dos semanas para comparar")
@@ -811,16 +1392,26 @@ def main():
 
                     week_1 = week_mapping[selected_week_1_label]
                     week_2 = week_mapping[selected_week_2_label]
+                    single_week = week_1 == week_2   # una sola semana → S2 repite S1
 
-                    # Totales metas/cobranza S1 y S2
-                    total_meta_1 = df_metas_summary[df_metas_summary["Semana"] == week_1]["Meta"].sum()
-                    total_cob_1 = df_cobranza[df_cobranza["Semana"] == week_1]["Depósito"].sum()
+                    # Agregados por semana (precalculados; luego búsqueda por semana)
+                    meta_wk = totales["meta_wk"]
+                    cob_wk = totales["cob_wk"]
+                    col_wk = totales["col_wk"]
+                    desc_wk = totales["desc_wk"]
 
-                    total_meta_2 = df_metas_summary[df_metas_summary["Semana"] == week_2]["Meta"].sum()
-                    total_cob_2 = df_cobranza[df_cobranza["Semana"] == week_2]["Depósito"].sum()
+                    # Totales metas/cobranza S1 y S2
+                    total_meta_1 = meta_wk.get(week_1, 0)
+                    total_cob_1 = cob_wk.get(week_1, 0)
 
                     cumplimiento_1 = round((total_cob_1 / total_meta_1 * 100), 2) if total_meta_1 > 0 else 0
-                    cumplimiento_2 = round((total_cob_2 / total_meta_2 * 100), 2) if total_meta_2 > 0 else 0
+
+                    if single_week:
+                        total_meta_2, total_cob_2, cumplimiento_2 = total_meta_1, total_cob_1, cumplimiento_1
+                    else:
+                        total_meta_2 = meta_wk.get(week_2, 0)
+                        total_cob_2 = cob_wk.get(week_2, 0)
+                        cumplimiento_2 = round((total_cob_2 / total_meta_2 * 100), 2) if total_meta_2 > 0 else 0
 
                     # Métricas (Metas vs Cobranza vs %)
                     col1, col2, col3 = st.columns(3)
@@ -828,23 +1419,20 @@ def main():
                     col2.metric("Cobranza Semana 1", format_money(total_cob_1))
                     col3.metric("% Cumplimiento S1", f"{cumplimiento_1}%")
 
-                    col4, col5, col6 = st.columns(3)
-                    col4.metric("Meta Semana 2", format_money(total_meta_2))
-                    col5.metric("Cobranza Semana 2", format_money(total_cob_2))
-                    col6.metric("% Cumplimiento S2", f"{cumplimiento_2}%")
+                    if not single_week:
+                        col4, col5, col6 = st.columns(3)
+                        col4.metric("Meta Semana 2", format_money(total_meta_2))
+                        col5.metric("Cobranza Semana 2", format_money(total_cob_2))
+                        col6.metric("% Cumplimiento S2", f"{cumplimiento_2}%")
 
                     # Gráfica comparativa Metas vs Cobranza S1 y S2
-                    global_data = pd.DataFrame({
-                        "Semana": [selected_week_1_label, selected_week_2_label],
-                        "Total Metas": [total_meta_1, total_meta_2],
-                        "Total Cobranza": [total_cob_1, total_cob_2]
+                    # (ya en formato largo: una fila por Semana-Tipo, sin melt)
+                    data_melt = pa.table({
+                        "Semana": [selected_week_1_label, selected_week_2_label] * 2,
+                        "Tipo": ["Total Metas"] * 2 + ["Total Cobranza"] * 2,
+                        "Monto": [float(total_meta_1), float(total_meta_2),
+                                  float(total_cob_1), float(total_cob_2)]
                     })
-                    data_melt = global_data.melt(
-                        id_vars=["Semana"],
-                        value_vars=["Total Metas", "Total Cobranza"],
-                        var_name="Tipo",
-                        value_name="Monto"
-                    )
                     chart_totals = alt.Chart(data_melt).mark_bar().encode(
                         x=alt.X("Semana:N"),
                         xOffset="Tipo:N",
@@ -855,17 +1443,21 @@ def main():
                     st.altair_chart(chart_totals, use_container_width=True)
 
                     # Gráfica depósitos diarios
-                    df_cob_2w = df_cobranza[df_cobranza["Semana"].isin([week_1, week_2])]
+                    # Sólo las columnas necesarias; assign evita el SettingWithCopy sobre el filtro
+                    df_cob_2w = df_cobranza.loc[
+                        df_cobranza["Semana"].eq(week_1) if single_week
+                        else df_cobranza["Semana"].isin([week_1, week_2]),
+                        ["Semana", "Fecha Transacción", "Depósito"]
+                    ]
                     if not df_cob_2w.empty:
-                        def map_label(semana):
-                            if semana == week_1:
-                                return selected_week_1_label
-                            elif semana == week_2:
-                                return selected_week_2_label
-                            return "Otros"
-
-                        df_cob_2w["SemanaLabel"] = df_cob_2w["Semana"].apply(map_label)
-                        df_cob_2w["Día"] = df_cob_2w["Fecha Transacción"].dt.day_name().str[:3]
+                        df_cob_2w = df_cob_2w.assign(
+                            SemanaLabel=np.where(
+                                df_cob_2w["Semana"].eq(week_1),
+                                selected_week_1_label,
+                                selected_week_2_label
+                            ),
+                            Día=df_cob_2w["Fecha Transacción"].dt.day_name().str[:3]
+                        )
                         df_cob_2w_agg = df_cob_2w.groupby(["SemanaLabel", "Día"], as_index=False)["Depósito"].sum()
                         df_cob_2w_agg.rename(columns={"Depósito": "TotalDia"}, inplace=True)
                         day_order = ["Sat", "Sun", "Mon", "Tue", "Wed", "Thu", "Fri"]
@@ -886,27 +1478,21 @@ def main():
                     week_2_credits_renewed = 0
 
                     if not df_col_agg.empty:
-                        week_1_credits_placed = df_col_agg[df_col_agg["Semana"] == week_1]["Creditos_Colocados"].sum()
-                        week_2_credits_placed = df_col_agg[df_col_agg["Semana"] == week_2]["Creditos_Colocados"].sum()
+                        week_1_credits_placed = col_wk["Creditos"].get(week_1, 0)
+                        week_2_credits_placed = col_wk["Creditos"].get(week_2, 0)
 
                     if not por_capturar_file or df_desc_agg.empty:
                         pass  # Asumimos 0 créditos renovados
                     else:
-                        df_week_1 = df_desc_agg[df_desc_agg["Semana"] == week_1]
-                        df_week_2 = df_desc_agg[df_desc_agg["Semana"] == week_2]
-                        week_1_credits_renewed = len(df_week_1)
-                        week_2_credits_renewed = len(df_week_2)
-
-                    data_credits = pd.DataFrame({
-                        "Semana": [selected_week_1_label, selected_week_2_label],
-                        "Créditos Colocados": [week_1_credits_placed, week_2_credits_placed],
-                        "Créditos Renovados": [week_1_credits_renewed, week_2_credits_renewed]
+                        week_1_credits_renewed = desc_wk["Renovados"].get(week_1, 0)
+                        week_2_credits_renewed = desc_wk["Renovados"].get(week_2, 0)
+
+                    data_credits_melt = pa.table({
+                        "Semana": [selected_week_1_label, selected_week_2_label] * 2,
+                        "Tipo": ["Créditos Colocados"] * 2 + ["Créditos Renovados"] * 2,
+                        "Cantidad": [int(week_1_credits_placed), int(week_2_credits_placed),
+                                     int(week_1_credits_renewed), int(week_2_credits_renewed)]
                     })
-                    data_credits_melt = data_credits.melt(
-                        id_vars="Semana",
-                        var_name="Tipo",
-                        value_name="Cantidad"
-                    )
                     st.markdown("#### Créditos Colocados y Créditos Renovados (Ambas Semanas)")
                     chart_credits = alt.Chart(data_credits_melt).mark_bar().encode(
                         x=alt.X("Semana:N"),
@@ -924,12 +1510,12 @@ def main():
                     week_2_desc = 0
 
                     if not df_col_agg.empty:
-                        week_1_venta = df_col_agg.loc[df_col_agg["Semana"] == week_1, "Venta"].sum()
-                        week_2_venta = df_col_agg.loc[df_col_agg["Semana"] == week_2, "Venta"].sum()
+                        week_1_venta = col_wk["Venta"].get(week_1, 0)
+                        week_2_venta = col_wk["Venta"].get(week_2, 0)
 
                     if not df_desc_agg.empty:
-                        week_1_desc = df_desc_agg.loc[df_desc_agg["Semana"] == week_1, "Descuento_Renovacion"].sum()
-                        week_2_desc = df_desc_agg.loc[df_desc_agg["Semana"] == week_2, "Descuento_Renovacion"].sum()
+                        week_1_desc = desc_wk["Desc"].get(week_1, 0)
+                        week_2_desc = desc_wk["Desc"].get(week_2, 0)
 
                     week_1_flujo = week_1_venta * 0.9
                     week_2_flujo = week_2_venta * 0.9
@@ -959,16 +1545,16 @@ def main():
             if df_promoters_summary.empty:
                 st.write("No hay promotores para mostrar.")
             else:
-                df_display = df_promoters_summary.copy()
-                df_display = df_display[~((df_display["Total Metas"]==0) & (df_display["Total Cobranza"]==0))]
-
-                df_display["Total Metas"] = df_display["Total Metas"].apply(format_money)
-                df_display["Total Cobranza"] = df_display["Total Cobranza"].apply(format_money)
-                df_display["Diferencia"] = df_display["Diferencia"].apply(format_money)
-                df_display["Antigüedad (meses)"] = df_display["Antigüedad (meses)"].round(2)
+                df_display = df_promoters_summary[
+                    ~((df_promoters_summary["Total Metas"]==0) & (df_promoters_summary["Total Cobranza"]==0))
+                ]
 
+                # Los montos siguen numéricos (ordenables); el formato se aplica al renderizar
                 st.dataframe(
-                    df_display[["N","Nombre","Antigüedad (meses)","Total Metas","Total Cobranza","Diferencia"]],
+                    style_money(
+                        df_display[["N","Nombre","Antigüedad (meses)","Total Metas","Total Cobranza","Diferencia"]],
+                        ["Total Metas","Total Cobranza","Diferencia"]
+                    ).format("{:.2f}", subset=["Antigüedad (meses)"], na_rep=""),
                     use_container_width=True
                 )
 
@@ -990,27 +1576,12 @@ def main():
             #    - df_metas_summary   →  Meta semanal por promotor
             #    - df_cobranza        →  Cobranza diaria
             # ------------------------------------------------------------------
-            # a) Metas semanales ya vienen agregadas (Promotor, Semana, Meta)
-            metas = df_metas_summary[["Promotor", "Semana", "Meta"]].copy()
-
-            # b) Cobranza semanal: sumamos depósitos por promotor / semana
-            cobranza = (
-                df_cobranza
-                .groupby(["N", "Semana"], as_index=False)["Depósito"]
-                .sum()
-                .rename(columns={"N": "Promotor", "Depósito": "Cobranza"})
-            )
-
-            # c) Merge → una fila por Promotor-Semana
-            df_base = (
-                pd.merge(metas, cobranza, on=["Promotor", "Semana"], how="outer")
-                .fillna(0)        # si faltó meta o cobro esa semana
-            )
+            df_base = compute_ranking_base(df_metas_summary, df_cobranza)
 
             # ------------------------------------------------------------------
             # 2) SELECTOR DE SEMANA  (Period[W-FRI] → sábado-viernes)
             # ------------------------------------------------------------------
-            semanas_disp = sorted(df_base["Semana"].unique(), key=lambda p: p.start_time)
+            semanas_disp = df_base["Semana"].drop_duplicates().sort_values().tolist()
             selected_week = st.selectbox(
                 "Semana a cierre:",
                 semanas_disp,
@@ -1022,24 +1593,26 @@ def main():
             # ------------------------------------------------------------------
             df_cum = (
                 df_base[df_base["Semana"] <= selected_week]
-                .groupby("Promotor", as_index=False)
+                .groupby("Promotor", as_index=False, observed=True)
                 .agg({"Meta": "sum", "Cobranza": "sum"})
             )
 
             # % de cumplimiento  |  evita división 0
-            df_cum["Cumplimiento %"] = (
-                df_cum.apply(
-                    lambda r: r["Cobranza"] / r["Meta"] * 100 if r["Meta"] else 0,
-                    axis=1
-                )
-            )
+            meta = df_cum["Meta"].to_numpy(dtype=np.float64)
+            cob = df_cum["Cobranza"].to_numpy(dtype=np.float64)
+            df_cum["Cumplimiento %"] = np.divide(
+                cob, meta, out=np.zeros_like(cob), where=meta != 0
+            ) * 100
+
+            # Clave numérica del código (P12 → 12), calculada una vez para filtro y orden
+            df_cum["_prom_int"] = df_cum["Promotor"].str.lstrip("P").astype("int32")
 
             # ------------------------------------------------------------------
             # 4) FILTRO OPCIONAL POR PROMOTORES (CÓDIGOS P1, P2, …)
             # ------------------------------------------------------------------
             proms_select = st.multiselect(
                 "Mostrar solo promotores (códigos):",
-                sorted(df_cum["Promotor"].unique(), key=lambda s: int(s.lstrip("P")))
+                df_cum.sort_values("_prom_int")["Promotor"].tolist()
             )
             if proms_select:
                 df_cum = df_cum[df_cum["Promotor"].isin(proms_select)]
@@ -1047,33 +1620,26 @@ def main():
             # ------------------------------------------------------------------
             # 5) AÑADIMOS NOMBRE PARA VISUALIZAR  (NO se usa para cálculos)
             # ------------------------------------------------------------------
-            code_to_name = dict(zip(df_control["N"], df_control["Nombre"]))
             df_cum["Nombre"] = df_cum["Promotor"].map(code_to_name)
 
             # ------------------------------------------------------------------
             # 6) ORDENAMOS POR % CUMPLIMIENTO  Y  POR CÓDIGO NATURAL
             # ------------------------------------------------------------------
             df_cum.sort_values(
-                ["Cumplimiento %", "Promotor"],
+                ["Cumplimiento %", "_prom_int"],
                 ascending=[False, True],
-                key=lambda col: (
-                    col if col.name != "Promotor" else col.str.lstrip("P").astype(int)
-                ),
                 inplace=True
             )
+            df_cum.drop(columns="_prom_int", inplace=True)
 
             # ------------------------------------------------------------------
-            # 7) FORMATO MONETARIO Y % CON 1 DECIMAL
-            # ------------------------------------------------------------------
-            df_cum["Meta"]      = df_cum["Meta"].apply(format_money)
-            df_cum["Cobranza"]  = df_cum["Cobranza"].apply(format_money)
-            df_cum["Cumplimiento %"] = df_cum["Cumplimiento %"].apply(lambda x: f"{x:,.1f}%")
-
-            # ------------------------------------------------------------------
-            # 8) MOSTRAMOS TABLA
+            # 7) MOSTRAMOS TABLA (formato monetario y % con 1 decimal vía Styler)
             # ------------------------------------------------------------------
             st.dataframe(
-                df_cum[["Promotor", "Nombre", "Meta", "Cobranza", "Cumplimiento %"]],
+                style_money(
+                    df_cum[["Promotor", "Nombre", "Meta", "Cobranza", "Cumplimiento %"]],
+                    ["Meta", "Cobranza"]
+                ).format("{:,.1f}%", subset=["Cumplimiento %"]),
                 use_container_width=True,
                 height=min(700, 35 + 25 * len(df_cum))
             )
@@ -1103,54 +1669,14 @@ def main():
             # --------------------------------------------------------------
             # 1) Cálculo de variación en el día promedio de pago
             # --------------------------------------------------------------
-            code_to_name = dict(zip(df_control["N"], df_control["Nombre"]))
-            all_prom_changes = []
-
-            for code, name in code_to_name.items():
-                df_prom = df_cobranza[df_cobranza["Nombre Promotor"] == name.upper()].copy()
-                if df_prom.empty:
-                    continue
-
-                df_prom["weighted_product"] = df_prom["Día_num"] * df_prom["Depósito"]
-                agg_df = df_prom.groupby("Semana").agg(
-                    sum_weighted_product=("weighted_product", "sum"),
-                    sum_deposito=("Depósito", "sum")
-                ).reset_index()
-                agg_df["Weighted_Day"] = agg_df["sum_weighted_product"] / agg_df["sum_deposito"]
-
-                df_weekly = agg_df[["Semana", "Weighted_Day"]].sort_values("Semana")
-                n = len(df_weekly)
-                if n < 2:
-                    continue
-
-                # Si hay 6 o más semanas, tomamos las últimas 6 y comparamos las mitades
-                if n >= 6:
-                    last_data = df_weekly.tail(6)
-                    first_avg = last_data.head(3)["Weighted_Day"].mean()
-                    last_avg = last_data.tail(3)["Weighted_Day"].mean()
-                else:
-                    half = n // 2
-                    first_avg = df_weekly.head(half)["Weighted_Day"].mean()
-                    last_avg = df_weekly.tail(half)["Weighted_Day"].mean()
-
-                diff = (last_avg - first_avg) if pd.notna(first_avg) and pd.notna(last_avg) else np.nan
-
-                all_prom_changes.append({
-                    "N": code,
-                    "Nombre": name,
-                    "Inicio Promedio": round(first_avg, 2) if pd.notna(first_avg) else np.nan,
-                    "Final Promedio": round(last_avg, 2) if pd.notna(last_avg) else np.nan,
-                    "Diferencia": round(diff, 2) if pd.notna(diff) else np.nan
-                })
-
-            df_change = pd.DataFrame(all_prom_changes)
+            df_change = compute_pattern_change(df_cobranza, code_to_name, code_to_name_upper)
 
             if df_change.empty:
                 st.write("No hay datos suficientes para mostrar cambios de patrón de pago.")
                 st.stop()
 
             # (Opcional) Mostramos la tabla de cambio de día de pago, con estilo en la columna 'Diferencia'
-            styled_change = df_change.style.applymap(style_difference, subset=["Diferencia"])
+            styled_change = df_change.style.apply(style_difference, subset=["Diferencia"])
             st.markdown("### Variación en el Día Promedio de Pago")
             st.dataframe(styled_change, use_container_width=True)
 
@@ -1160,96 +1686,51 @@ def main():
             from datetime import datetime
             today = datetime.today()
 
-            df_cobranza_closed = df_cobranza[df_cobranza["Semana"].apply(lambda w: w.end_time < today)]
-            df_metas_closed = df_metas_summary[df_metas_summary["Semana"].apply(lambda w: w.end_time < today)]
-
-            def get_recent_weeks_compliance(promotor_code, df_metas, df_cob, top_weeks=4):
-                if promotor_code not in code_to_name:
-                    return 0.0
-                name_upper = code_to_name[promotor_code].upper()
-
-                df_meta_p = df_metas[df_metas["Promotor"] == promotor_code]
-                df_cob_p = df_cob[df_cob["Nombre Promotor"] == name_upper]
-
-                metas_sem = df_meta_p.groupby("Semana")["Meta"].sum()
-                cob_sem = df_cob_p.groupby("Semana")["Depósito"].sum()
-
-                df_weeks = pd.DataFrame({"Meta": metas_sem, "Cobranza": cob_sem}).fillna(0)
-                df_weeks = df_weeks.sort_index(ascending=False).head(top_weeks)
-
-                df_weeks["Cumplimiento"] = df_weeks.apply(
-                    lambda row: (row["Cobranza"]/row["Meta"]) * 100 if row["Meta"] > 0 else 0,
-                    axis=1
-                ) if not df_weeks.empty else pd.Series()
-                return round(df_weeks["Cumplimiento"].mean(), 2) if not df_weeks.empty else 0
-
-            # Construimos df_risk uniendo la info
-            risk_rows = []
-            for _, row in df_change.iterrows():
-                code = row["N"]
-                avg_4w = get_recent_weeks_compliance(code, df_metas_closed, df_cobranza_closed, 4)
-                risk_rows.append({
-                    "N": code,
-                    "Nombre": row["Nombre"],
-                    "Inicio Promedio (día pago)": row["Inicio Promedio"],
-                    "Final Promedio (día pago)": row["Final Promedio"],
-                    "Diferencia": row["Diferencia"],
-                    "Cumpl. 4 Semanas (%)": avg_4w
-                })
-
-            df_risk = pd.DataFrame(risk_rows)
+            # Semanas ya cerradas = anteriores a la semana (W-FRI) en curso.
+            # Construimos df_risk uniendo la info (cumplimiento de todos los promotores de una vez)
+            cumpl_4w = closed_weeks_compliance(
+                df_metas_summary, df_cobranza, code_to_name_upper, pd.Period(today, freq="W-FRI"), 4
+            )
+            df_risk = df_change.rename(columns={
+                "Inicio Promedio": "Inicio Promedio (día pago)",
+                "Final Promedio": "Final Promedio (día pago)",
+            }).assign(**{"Cumpl. 4 Semanas (%)": df_change["N"].map(cumpl_4w).fillna(0)})
 
             # --------------------------------------------------------------
             # 3) Score de Riesgo (puedes ajustar la fórmula)
             # --------------------------------------------------------------
-            def compliance_component_mod(cumpl):
-                if cumpl >= 95:
-                    return 0
-                elif cumpl >= 80:
-                    return (95 - cumpl) / (95 - 80)
-                else:
-                    return 1
-
-            def delay_component_mod(diff):
-                if diff <= 0:
-                    return 0
-                delay_pos = min(diff, 3)
-                return delay_pos / 3.0
-
             weight_cumpl = 0.7
             weight_delay = 0.3
 
-            df_risk["comp_component"] = df_risk["Cumpl. 4 Semanas (%)"].apply(compliance_component_mod)
-            df_risk["delay_component"] = df_risk["Diferencia"].apply(delay_component_mod)
+            # Componente de cumplimiento: 0 si ≥95, lineal entre 95 y 80, 1 si <80
+            cumpl = df_risk["Cumpl. 4 Semanas (%)"].to_numpy(dtype=np.float64)
+            df_risk["comp_component"] = np.select(
+                [cumpl >= 95, cumpl >= 80],
+                [0.0, (95 - cumpl) / (95 - 80)],
+                default=1.0
+            )
+            # Componente de atraso: 0 si no se atrasó, proporcional hasta 3 días
+            diff = df_risk["Diferencia"].to_numpy(dtype=np.float64)
+            df_risk["delay_component"] = np.clip(diff, 0, 3) / 3.0
             df_risk["score_0to1"] = (weight_cumpl * df_risk["comp_component"] +
                                      weight_delay * df_risk["delay_component"])
             df_risk["score_riesgo"] = (df_risk["score_0to1"] * 100).round(2)
 
             # --------------------------------------------------------------
             # 4) Separar default (<7% de cumplimiento) de la lista principal
+            #    con una sola máscara; ambas listas ordenadas por score
             # --------------------------------------------------------------
-            df_default = df_risk[df_risk["Cumpl. 4 Semanas (%)"] < 7].copy()
-            df_principal = df_risk[df_risk["Cumpl. 4 Semanas (%)"] >= 7].copy()
-
-            # --------------------------------------------------------------
-            # 5) Colorear el score_riesgo: (<11 verde, <35 naranja, >=35 rojo)
-            # --------------------------------------------------------------
-            def style_risk_score(val):
-                if val < 11:
-                    return "background-color: green; color: white;"
-                elif val < 35:
-                    return "background-color: orange; color: black;"
-                else:
-                    return "background-color: red; color: white;"
+            en_default = df_risk["Cumpl. 4 Semanas (%)"].to_numpy() < 7
+            df_default = df_risk[en_default].sort_values("score_riesgo", ascending=False)
+            df_principal = df_risk[~en_default].sort_values("score_riesgo", ascending=False)
 
             # --------------------------------------------------------------
-            # 6) Mostrar Ranking Principal
+            # 5) Mostrar Ranking Principal
             # --------------------------------------------------------------
             st.markdown("### Ranking Principal (con 7% o más de Cumplimiento en 4 Semanas)")
 
-            df_principal.sort_values("score_riesgo", ascending=False, inplace=True)
-
-            # Seleccionamos columnas en el DataFrame, luego aplicamos estilo
+            # Seleccionamos columnas en el DataFrame, luego coloreamos score_riesgo
+            # (<11 verde, <35 naranja, >=35 rojo) con style_risk_score por columna
             df_principal_subset = df_principal[
                 ["N", "Nombre",
                  "Inicio Promedio (día pago)",
@@ -1257,9 +1738,9 @@ def main():
                  "Diferencia",
                  "Cumpl. 4 Semanas (%)",
                  "score_riesgo"]
-            ].copy()
+            ]
 
-            df_principal_styled = df_principal_subset.style.applymap(
+            df_principal_styled = df_principal_subset.style.apply(
                 style_risk_score,
                 subset=["score_riesgo"]
             )
@@ -1267,14 +1748,12 @@ def main():
             st.dataframe(df_principal_styled, use_container_width=True)
 
             # --------------------------------------------------------------
-            # 7) Listado de promotores en default (<7%)
+            # 6) Listado de promotores en default (<7%)
             # --------------------------------------------------------------
             if not df_default.empty:
                 st.markdown("### Promotores en Default (Cumplimiento <7%)")
                 st.write("Estos promotores se excluyen del ranking principal.")
 
-                df_default.sort_values("score_riesgo", ascending=False, inplace=True)
-
                 df_default_subset = df_default[
                     ["N", "Nombre",
                      "Inicio Promedio (día pago)",
@@ -1282,9 +1761,9 @@ def main():
                      "Diferencia",
                      "Cumpl. 4 Semanas (%)",
                      "score_riesgo"]
-                ].copy()
+                ]
 
-                df_default_styled = df_default_subset.style.applymap(
+                df_default_styled = df_default_subset.style.apply(
                     style_risk_score,
                     subset=["score_riesgo"]
                 )
@@ -1300,8 +1779,7 @@ def main():
             st.header("Incumplimiento Semanal")
 
             # 1) Selector de semana
-            semanas_disp = sorted(df_metas_summary["Semana"].unique(),
-                                  key=lambda p: p.start_time)
+            semanas_disp = df_metas_summary["Semana"].drop_duplicates().sort_values().tolist()
             selected_week = st.selectbox(
                 "Selecciona la semana a evaluar:",
                 semanas_disp,
@@ -1309,45 +1787,12 @@ def main():
             )
 
             # ---------- DATASETS --------------------------------------------------
-            # a) Metas y cobranza de la semana
-            df_meta_w = df_metas_summary[df_metas_summary["Semana"] == selected_week][
-                ["Promotor", "Meta"]
-            ]
-            df_cob_w = (
-                df_cobranza[df_cobranza["Semana"] == selected_week]
-                .groupby("N", as_index=False)["Depósito"]
-                .sum()
-                .rename(columns={"N": "Promotor", "Depósito": "Cobranza"})
-            )
-
-            # b) Metas y cobranza ACUMULADAS hasta la semana seleccionada
-            df_meta_cum = (
-                df_metas_summary[df_metas_summary["Semana"] <= selected_week]
-                .groupby("Promotor", as_index=False)["Meta"]
-                .sum()
-                .rename(columns={"Meta": "MetaAcum"})
-            )
-            df_cob_cum = (
-                df_cobranza[df_cobranza["Semana"] <= selected_week]
-                .groupby("N", as_index=False)["Depósito"]
-                .sum()
-                .rename(columns={"N": "Promotor", "Depósito": "CobranzaAcum"})
+            # Agregados semanales y acumulados (cacheados por semana seleccionada)
+            df_semana, total_meta, total_cob = compute_week_tables(
+                df_metas_summary, df_cobranza, selected_week
             )
 
-            # c) Fusionamos todo
-            df_semana = (
-                pd.merge(df_meta_w, df_cob_w, on="Promotor", how="outer")
-                .merge(df_meta_cum, on="Promotor", how="outer")
-                .merge(df_cob_cum, on="Promotor", how="outer")
-                .fillna(0)
-            )
-
-            # d) Diferencias
-            df_semana["DifSemana"] = df_semana["Cobranza"]     - df_semana["Meta"]
-            df_semana["DifAcum"]   = df_semana["CobranzaAcum"] - df_semana["MetaAcum"]
-
             # e) Nombre legible
-            code_to_name = dict(zip(df_control["N"], df_control["Nombre"]))
             df_semana["Nombre"] = df_semana["Promotor"].map(code_to_name)
 
             # ---------- FILTROS SEGÚN REGLAS -------------------------------------
@@ -1356,24 +1801,17 @@ def main():
                 (df_semana["Meta"] > 0) &                       # meta semanal positiva
                 (df_semana["Cobranza"]   < df_semana["Meta"]) & # NO cumplió la meta de la semana
                 (df_semana["CobranzaAcum"] < df_semana["MetaAcum"])  # sigue atrasado acumulado
-            ].copy()
+            ].sort_values("_prom_int")   # Orden P1, P2…
 
 
             # Meta 0 con depósito: meta = 0  Y  cob_semana > 0
             df_meta0_dep = df_semana[
                 (df_semana["Meta"] == 0) &
                 (df_semana["Cobranza"] > 0)
-            ].copy()
-
-            # Orden P1, P2…
-            sort_key = lambda s: s.str.lstrip("P").astype(int)
-            df_incumplidos.sort_values("Promotor", key=sort_key, inplace=True)
-            df_meta0_dep.sort_values("Promotor", key=sort_key, inplace=True)
+            ].sort_values("_prom_int")
 
             # ---------- MÉTRICAS RESUMEN (ANTES DE LA TABLA) ----------------------
             # --- NUEVAS MÉTRICAS -----------------------------------------------------
-            total_meta  = df_meta_w["Meta"].sum()
-            total_cob   = df_cob_w["Cobranza"].sum()
             porcentaje  = (total_cob / total_meta * 100) if total_meta else 0
             
             col1, col2, col3, col4 = st.columns(4)
@@ -1389,12 +1827,9 @@ def main():
                 f"{selected_week.end_time.strftime('%d %b %Y')}"
             )
 
-            # ---------- FORMATEO --------------------------------------------------
+            # ---------- FORMATEO (sólo de presentación, los datos siguen numéricos) ----
             money_cols = ["Meta", "Cobranza", "MetaAcum", "CobranzaAcum",
                           "DifSemana", "DifAcum"]
-            for col in money_cols:
-                df_incumplidos[col] = df_incumplidos[col].apply(format_money)
-                df_meta0_dep[col]   = df_meta0_dep[col].apply(format_money)
 
             # ---------- TABLA 1: INCUMPLIDOS --------------------------------------
             st.markdown("### Promotores que **NO** alcanzan la meta (considerando adelantos)")
@@ -1402,11 +1837,11 @@ def main():
                 st.success("🎉 Ningún promotor incumple su meta esta semana.")
             else:
                 st.dataframe(
-                    df_incumplidos[[
+                    style_money(df_incumplidos[[
                         "Promotor", "Nombre",
                         "Meta", "Cobranza", "DifSemana",
                         "MetaAcum", "CobranzaAcum", "DifAcum"
-                    ]],
+                    ]], money_cols),
                     use_container_width=True,
                     height=min(400, 35 + 25 * len(df_incumplidos))
                 )
@@ -1417,11 +1852,11 @@ def main():
                 st.info("No hay depósitos registrados en promotores con meta 0.")
             else:
                 st.dataframe(
-                    df_meta0_dep[[
+                    style_money(df_meta0_dep[[
                         "Promotor", "Nombre",
                         "Meta", "Cobranza", "DifSemana",
                         "MetaAcum", "CobranzaAcum", "DifAcum"
-                    ]],
+                    ]], money_cols),
                     use_container_width=True,
                     height=min(400, 35 + 25 * len(df_meta0_dep))
                 )
@@ -1441,7 +1876,10 @@ def main():
                 # -------------------------------------------------------------
                 search_term = st.text_input("Buscar promotor (por nombre parcial)")
                 if search_term:
-                    filtered_promoters = df_control[df_control["Nombre"].str.contains(search_term, case=False, na=False)]
+                    # Búsqueda literal sobre la columna ya en mayúsculas (sin regex ni case=False)
+                    filtered_promoters = df_control[
+                        df_control["Nombre_upper"].str.contains(search_term.upper(), regex=False, na=False)
+                    ]
                 else:
                     filtered_promoters = df_control
 
@@ -1461,8 +1899,18 @@ def main():
                         nombre_promotor = df_match["Nombre"].iloc[0]
                         antiguedad_val = df_match["Antigüedad (meses)"].iloc[0] if "Antigüedad (meses)" in df_match else None
 
+                        # Subconjuntos del promotor por posiciones precalculadas (sin escanear columnas)
+                        df_cob_prom = take_promoter(
+                            df_cobranza, promoter_row_positions(df_cobranza["N"]), promotor_sel
+                        )
+                        df_meta_prom = take_promoter(
+                            df_metas_summary, promoter_row_positions(df_metas_summary["Promotor"]), promotor_sel
+                        )
+                        df_pagos_prom_raw = take_promoter(
+                            df_pagos_raw, promoter_row_positions(df_pagos_raw["N"]), promotor_sel
+                        )
+
                         # Muestra Estado/Municipio (si existen datos)
-                        df_cob_prom = df_cobranza[df_cobranza["N"] == promotor_sel].copy()
 
                         estados     = df_cob_prom["Estado"].dropna().unique()
                         municipios  = df_cob_prom["Municipio"].dropna().unique()
@@ -1478,10 +1926,6 @@ def main():
                         from datetime import datetime     # ya está importado antes; si no, añade una sola vez
 
 
-                        # --- Metas históricas del promotor (necesarias para el resumen semanal) ---
-                        df_meta_prom = df_metas_summary[df_metas_summary["Promotor"] == promotor_sel]
-
-
                         # -------------------------------------------------------------
                         # META VS. COBRANZA TOTALES
                         # -------------------------------------------------------------
@@ -1490,23 +1934,24 @@ def main():
                         # -------------------------------------------------------------
                         # ---------- KPI RESUMEN DEL PROMOTOR  (tarjetas grandes) -----------------
                         # 1) Recalcula totales históricos (en caso de que aún no existan)
-                        meta_hist = df_metas_summary.loc[
-                            df_metas_summary["Promotor"] == promotor_sel, "Meta"
-                        ].sum()
-
-                        cob_hist = df_cobranza.loc[
-                            df_cobranza["N"] == promotor_sel, "Depósito"
-                        ].sum()
+                        meta_hist = df_meta_prom["Meta"].sum()
+                        cob_hist = df_cob_prom["Depósito"].sum()
 
                         dif_hist = cob_hist - meta_hist
                         # --- Cálculo de KPIs del estado actual -----------------------------------
                         hoy = datetime.now().date()
-                        df_pagos_prom_raw = df_pagos_raw[df_pagos_raw["N"] == promotor_sel].copy()
 
-                        clientes_activos      = (df_pagos_prom_raw["VENCI"].dt.date >= hoy).sum()
-                        clientes_vencidos     = ((df_pagos_prom_raw["VENCI"].dt.date < hoy) & (df_pagos_prom_raw["SV"] > 0)).sum()
+                        # Máscaras sobre datetime64 directamente (sin convertir a objetos date; NaT → False)
+                        hoy64 = np.datetime64(hoy)
+                        venci = df_pagos_prom_raw["VENCI"].to_numpy()
+                        sv    = df_pagos_prom_raw["SV"].to_numpy()
+                        ps    = df_pagos_prom_raw["PS"].to_numpy()
+                        vigente = venci >= hoy64
+
+                        clientes_activos      = int(vigente.sum())
+                        clientes_vencidos     = int(((venci < hoy64) & (sv > 0)).sum())
                         saldo_vencido_total   = df_pagos_prom_raw["SV"].sum()
-                        clientes_atrasados    = ((df_pagos_prom_raw["VENCI"].dt.date >= hoy) & (df_pagos_prom_raw["SV"] > df_pagos_prom_raw["PS"])).sum()
+                        clientes_atrasados    = int((vigente & (sv > ps)).sum())
                         cartera_ind           = df_pagos_prom_raw["SALDO"].sum()
 
                         # 2) Primera fila: situación actual
@@ -1541,37 +1986,26 @@ def main():
                                 start_week = df_meta_prom["Semana"].min()
                                 end_week = df_meta_prom["Semana"].max()
 
-                            full_weeks = pd.period_range(
-                                start=start_week.start_time,
-                                end=end_week.end_time,
-                                freq="W-FRI"
+                            # Meta y cobranza por semana alineadas por índice y completadas
+                            # con todas las semanas del rango (ya en orden cronológico)
+                            df_merge = reindex_weeks(
+                                pd.concat({
+                                    "Cobranza Meta": df_meta_prom.groupby("Semana")["Meta"].sum(),
+                                    "Cobranza Realizada": df_cob_summary.set_index("Semana")["Depósito"],
+                                }, axis=1)
+                                .fillna(0)
+                                .rename_axis("Semana")
+                                .reset_index(),
+                                start_week.start_time,
+                                end_week.end_time
                             )
-                            df_weeks = pd.DataFrame({"Semana": full_weeks})
 
-                            df_merge = pd.merge(
-                                df_weeks,
-                                df_meta_prom[["Semana", "Meta"]],
-                                on="Semana", how="left"
-                            )
-                            df_merge = pd.merge(
-                                df_merge,
-                                df_cob_summary[["Semana", "Depósito"]],
-                                on="Semana", how="left"
-                            )
-                            df_merge.rename(columns={"Meta": "Cobranza Meta", "Depósito": "Cobranza Realizada"}, inplace=True)
-                            df_merge[["Cobranza Meta", "Cobranza Realizada"]] = df_merge[["Cobranza Meta", "Cobranza Realizada"]].fillna(0)
-
-                            df_merge["Cumplimiento (%)"] = df_merge.apply(
-                                lambda row: round(row["Cobranza Realizada"] / row["Cobranza Meta"] * 100, 2)
-                                if row["Cobranza Meta"] > 0 else 0,
-                                axis=1
-                            )
-
-                            df_merge.sort_values(
-                                by="Semana",
-                                key=lambda col: col.apply(lambda p: p.start_time),
-                                inplace=True
-                            )
+                            # Cumplimiento por columna (0 si no hubo meta), sin apply por fila
+                            meta_sem = df_merge["Cobranza Meta"].to_numpy(dtype=np.float64)
+                            cob_sem = df_merge["Cobranza Realizada"].to_numpy(dtype=np.float64)
+                            df_merge["Cumplimiento (%)"] = np.round(np.divide(
+                                cob_sem, meta_sem, out=np.zeros_like(cob_sem), where=meta_sem > 0
+                            ) * 100, 2)
 
                             st.write("#### Resumen Semanal del Promotor (Meta vs. Cobranza)")
                             st.dataframe(
@@ -1612,27 +2046,20 @@ def main():
                             st.info("No se encontraron datos de colocaciones en general.")
                         else:
                             # Filtrar df_col_merge por promotor (código)
-                            df_sel = df_col_merge[df_col_merge["N"] == promotor_sel].copy()
-                            if df_sel.empty:
+                            # Colocaciones + descuentos ya unidos por ["N","Semana"] (sin merge por render)
+                            df_merged = take_promoter(
+                                df_col_desc, promoter_row_positions(df_col_desc["N"]), promotor_sel
+                            )
+                            if df_merged.empty:
                                 st.write("No hay registros de colocación para este promotor.")
                             else:
-                                # <-- CAMBIO: merge por ["N","Semana"] en lugar de nombres
-                                df_merged = pd.merge(
-                                    df_sel,
-                                    df_desc_agg,  # ya contiene ["N","Semana","Descuento_Renovacion"]
-                                    left_on=["N","Semana"],
-                                    right_on=["N","Semana"],
-                                    how="left"
-                                )
-                                df_merged["Descuento_Renovacion"] = df_merged["Descuento_Renovacion"].fillna(0)
-
                                 total_credits_placed = df_merged["Creditos_Colocados"].sum()
 
                                 # Contar filas con descuento > 0 en df_desc_agg (mismo N)
-                                df_desc_renov = df_desc_agg[
-                                    (df_desc_agg["N"] == promotor_sel) &
-                                    (df_desc_agg["Descuento_Renovacion"] > 0)
-                                ]
+                                df_desc_prom = take_promoter(
+                                    df_desc_agg, promoter_row_positions(df_desc_agg["N"]), promotor_sel
+                                )
+                                df_desc_renov = df_desc_prom[df_desc_prom["Descuento_Renovacion"] > 0]
                                 total_credits_renewed = len(df_desc_renov)
                                 total_credits_new = total_credits_placed - total_credits_renewed
                                 if total_credits_new < 0:
@@ -1665,25 +2092,10 @@ def main():
                                 min_week = df_agr["Semana"].min()
                                 max_week = df_agr["Semana"].max()
                                 if pd.notna(min_week) and pd.notna(max_week):
-                                    full_weeks = pd.period_range(
-                                        start=min_week.start_time,
-                                        end=max_week.end_time,
-                                        freq="W-FRI"
-                                    )
-                                    df_weeks = pd.DataFrame({"Semana": full_weeks})
-                                    df_full = pd.merge(df_weeks, df_agr, on="Semana", how="left").fillna(0)
-                                    df_full = df_full.sort_values(
-                                        by="Semana",
-                                        key=lambda col: col.apply(lambda p: p.start_time)
-                                    )
+                                    df_full = reindex_weeks(df_agr, min_week.start_time, max_week.end_time)
                                 else:
                                     df_full = df_agr.copy()
 
-                                df_full["Venta"] = df_full["Venta"].apply(format_money)
-                                df_full["Flujo"] = df_full["Flujo"].apply(format_money)
-                                df_full["Descuento_Renovacion"] = df_full["Descuento_Renovacion"].apply(format_money)
-                                df_full["Flujo Final"] = df_full["Flujo Final"].apply(format_money)
-
                                 # ---------- KPIs de Colocación de Créditos ------------------------------
                     
                                 # (1) Totales
@@ -1704,14 +2116,15 @@ def main():
 
                                 st.markdown("#### Detalle Semanal de Colocación de Créditos")
                                 st.dataframe(
-                                    df_full[[
+                                    style_money(df_full[[
                                         "Semana",
                                         "Creditos_Colocados",
                                         "Venta",
                                         "Flujo",
                                         "Descuento_Renovacion",
                                         "Flujo Final"
-                                    ]],
+                                    ]].astype({"Creditos_Colocados": "int64"}),
+                                        ["Venta", "Flujo", "Descuento_Renovacion", "Flujo Final"]),
                                     use_container_width=True
                                 )
 
@@ -1742,63 +2155,41 @@ def main():
                 st.stop()
 
             # 1) Selección de promotor (código P1, P2…)
-            codigos = sorted(df_control["N"].unique(), key=lambda x: int(x.lstrip("P")))
-            promotor_sel = st.selectbox("Selecciona promotor (código):", codigos, key="creditos_detalle_promotor_sel")
+            promotor_sel = st.selectbox("Selecciona promotor (código):", codes_sorted, key="creditos_detalle_promotor_sel")
             
             if not promotor_sel:
                 st.info("Por favor, selecciona un promotor.")
                 st.stop()
 
-            nombre_promotor_info = df_control.loc[df_control["N"] == promotor_sel, "Nombre"]
-            if nombre_promotor_info.empty:
+            nombre_promotor_display = code_to_name.get(promotor_sel)
+            if nombre_promotor_display is None:
                 st.error(f"No se encontró el nombre para el promotor con código {promotor_sel}.")
                 nombre_promotor_display = "Desconocido"
-            else:
-                nombre_promotor_display = nombre_promotor_info.iat[0]
             
             st.markdown(f"**Promotor:** {promotor_sel} — {nombre_promotor_display}")
 
             # 2) Filtramos datos de Colocación (usando df_colocaciones_info_completa) y Cobranza
             if df_colocaciones_info_completa.empty or "N" not in df_colocaciones_info_completa.columns:
                 st.warning("No hay datos de colocaciones detallados o falta la columna 'N' para filtrar.")
-                df_col_prom_original = pd.DataFrame()
+                df_col_prom = pd.DataFrame()
             else:
-                df_col_prom_original = df_colocaciones_info_completa[df_colocaciones_info_completa["N"] == promotor_sel].copy()
+                # iloc ya devuelve un DataFrame propio: no hace falta otra copia defensiva
+                df_col_prom = take_promoter(
+                    df_colocaciones_info_completa,
+                    promoter_row_positions(df_colocaciones_info_completa["N"]),
+                    promotor_sel
+                )
 
             if df_cobranza.empty or "N" not in df_cobranza.columns:
                 st.warning("No hay datos de cobranza o falta la columna 'N' para filtrar.")
                 df_cob_prom = pd.DataFrame()
             else:
-                df_cob_prom = df_cobranza[df_cobranza["N"] == promotor_sel].copy()
-
-
-            # Normalizar y renombrar columnas de Cobranza (como en tu código original)
-            if not df_cob_prom.empty:
-                df_cob_prom.columns = (
-                    df_cob_prom.columns
-                    .str.strip()
-                    .str.lower()
-                    .str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("utf-8")
+                # Encabezados ya normalizados (una vez por archivo); mismas filas que df_cobranza
+                df_cob_prom = take_promoter(
+                    prepare_cobranza_creditos(df_cobranza),
+                    promoter_row_positions(df_cobranza["N"]),
+                    promotor_sel
                 )
-                # Renombres selectivos para evitar errores si una columna no existe
-                cob_rename_map = {
-                    "contrato": "Contrato", # Asegúrate que 'contrato' es el nombre normalizado
-                    "deposito": "Deposito", # Asegúrate que 'deposito' es el nombre normalizado
-                    "fecha transaccion": "FechaTrans" # Asegúrate que 'fecha transaccion' es el nombre normalizado
-                }
-                actual_cob_renames = {k: v for k, v in cob_rename_map.items() if k in df_cob_prom.columns}
-                df_cob_prom.rename(columns=actual_cob_renames, inplace=True)
-
-                if "FechaTrans" in df_cob_prom.columns:
-                    df_cob_prom["FechaTrans"] = pd.to_datetime(df_cob_prom["FechaTrans"], errors="coerce")
-                if "Deposito" in df_cob_prom.columns:
-                    df_cob_prom["Deposito"] = pd.to_numeric(df_cob_prom["Deposito"], errors="coerce").fillna(0) # Asumimos que convert_number ya se aplicó en la carga
-                else: # Si Deposito no existe tras renombrar, añadirlo como 0 para evitar errores
-                    df_cob_prom["Deposito"] = 0
-
-
-            # Trabajar con df_col_prom_original para el detalle de colocaciones
-            df_col_prom = df_col_prom_original.copy() # df_col_prom será el DataFrame de trabajo
 
             if df_col_prom.empty:
                 st.info(f"No se encontraron créditos colocados para el promotor {promotor_sel}.")
@@ -1822,7 +2213,7 @@ def main():
                 
                 # Aplicar renombres solo si las columnas existen
                 actual_col_renames = {k: v for k, v in rename_map_colocaciones.items() if k in df_col_prom.columns}
-                df_col_prom.rename(columns=actual_col_renames, inplace=True)
+                df_col_prom = df_col_prom.rename(columns=actual_col_renames)
 
                 # Validar columnas críticas DESPUÉS de intentar renombrar
                 if "FechaPrimerPago" not in df_col_prom.columns:
@@ -1850,163 +2241,133 @@ def main():
                      st.markdown(f"**Columnas disponibles en datos de colocación para este promotor:** `{', '.join(df_col_prom.columns.tolist())}`")
                      # No se puede continuar sin Contrato para el cruce, pero la tabla se puede mostrar parcialmente
                 
-                # Convertir tipos de datos (si no se hizo ya al cargar df_colocaciones_info_completa)
-                df_col_prom["FechaPrimerPago"] = pd.to_datetime(df_col_prom["FechaPrimerPago"], errors="coerce")
-                df_col_prom["PS"] = pd.to_numeric(df_col_prom["PS"], errors="coerce").fillna(0)
-
-                # ... (código anterior donde se definen y renombran df_col_prom y df_cob_prom)
-
-                st.markdown("--- DEBUG INFO ---") # Para separar visualmente
-
-                # Información de df_col_prom (Colocaciones)
-                st.subheader("DEBUG: Datos de Colocación (df_col_prom)")
-                if not df_col_prom.empty:
-                    if "Contrato" in df_col_prom.columns:
-                        st.write("Primeros 5 'Contrato' en Colocaciones:", df_col_prom["Contrato"].head().tolist())
-                        st.write("Tipo de dato 'Contrato' en Colocaciones:", df_col_prom["Contrato"].dtype)
-                        st.write(f"Total de créditos para este promotor en Colocaciones: {len(df_col_prom)}")
+                # Convertir tipos de datos sólo si no se hizo ya al cargar df_colocaciones_info_completa
+                df_col_prom["FechaPrimerPago"] = ensure_datetime(df_col_prom["FechaPrimerPago"])
+                if not pd.api.types.is_numeric_dtype(df_col_prom["PS"]):
+                    df_col_prom["PS"] = pd.to_numeric(df_col_prom["PS"], errors="coerce").fillna(0)
+
+                # Diagnóstico de cruces Colocación ↔ Cobranza: sólo con 🔧 Modo debug
+                if debug_mode:
+                    st.markdown("--- DEBUG INFO ---") # Para separar visualmente
+
+                    # Información de df_col_prom (Colocaciones)
+                    st.subheader("DEBUG: Datos de Colocación (df_col_prom)")
+                    if not df_col_prom.empty:
+                        if "Contrato" in df_col_prom.columns:
+                            st.write("Primeros 5 'Contrato' en Colocaciones:", df_col_prom["Contrato"].head().tolist())
+                            st.write("Tipo de dato 'Contrato' en Colocaciones:", df_col_prom["Contrato"].dtype)
+                            st.write(f"Total de créditos para este promotor en Colocaciones: {len(df_col_prom)}")
+                        else:
+                            st.warning("Columna 'Contrato' NO ENCONTRADA en df_col_prom (Colocaciones).")
+                            st.write("Columnas disponibles en df_col_prom:", df_col_prom.columns.tolist())
                     else:
-                        st.warning("Columna 'Contrato' NO ENCONTRADA en df_col_prom (Colocaciones).")
-                        st.write("Columnas disponibles en df_col_prom:", df_col_prom.columns.tolist())
-                else:
-                    st.write("df_col_prom (Colocaciones) está vacío para este promotor.")
-
-                # Información de df_cob_prom (Cobranza)
-                st.subheader("DEBUG: Datos de Cobranza (df_cob_prom)")
-                if not df_cob_prom.empty:
-                    if "Contrato" in df_cob_prom.columns:
-                        st.write("Primeros 5 'Contrato' en Cobranzas:", df_cob_prom["Contrato"].head().tolist())
-                        st.write("Tipo de dato 'Contrato' en Cobranzas:", df_cob_prom["Contrato"].dtype)
-                        st.write(f"Total de registros de cobranza para este promotor: {len(df_cob_prom)}")
-
-                        # Intentar encontrar un contrato de colocaciones en cobranzas
-                        if not df_col_prom.empty and "Contrato" in df_col_prom.columns and len(df_col_prom["Contrato"]) > 0:
-                            primer_contrato_col = df_col_prom["Contrato"].iloc[0]
-                            st.write(f"Buscando el primer contrato de colocaciones ('{primer_contrato_col}') en Cobranzas:")
-                            pagos_encontrados_debug = df_cob_prom[df_cob_prom["Contrato"] == str(primer_contrato_col)] # Forzar a string por si acaso
-                            if not pagos_encontrados_debug.empty:
-                                st.success(f"¡ENCONTRADO! Se encontraron {len(pagos_encontrados_debug)} pagos para el contrato '{primer_contrato_col}'.")
-                                st.dataframe(pagos_encontrados_debug[["Contrato", "Deposito", "FechaTrans"]].head())
-                            else:
-                                st.error(f"NO ENCONTRADO. Ningún pago para el contrato '{primer_contrato_col}' en Cobranzas.")
-                                st.write(f"Primeros 20 valores únicos de 'Contrato' en Cobranzas para comparar: {df_cob_prom['Contrato'].astype(str).unique()[:20]}")
+                        st.write("df_col_prom (Colocaciones) está vacío para este promotor.")
+
+                    # Información de df_cob_prom (Cobranza)
+                    st.subheader("DEBUG: Datos de Cobranza (df_cob_prom)")
+                    if not df_cob_prom.empty:
+                        if "Contrato" in df_cob_prom.columns:
+                            st.write("Primeros 5 'Contrato' en Cobranzas:", df_cob_prom["Contrato"].head().tolist())
+                            st.write("Tipo de dato 'Contrato' en Cobranzas:", df_cob_prom["Contrato"].dtype)
+                            st.write(f"Total de registros de cobranza para este promotor: {len(df_cob_prom)}")
+
+                            # Intentar encontrar un contrato de colocaciones en cobranzas
+                            if not df_col_prom.empty and "Contrato" in df_col_prom.columns and len(df_col_prom["Contrato"]) > 0:
+                                primer_contrato_col = df_col_prom["Contrato"].iloc[0]
+                                st.write(f"Buscando el primer contrato de colocaciones ('{primer_contrato_col}') en Cobranzas:")
+                                pagos_encontrados_debug = df_cob_prom[df_cob_prom["Contrato"] == str(primer_contrato_col)] # Forzar a string por si acaso
+                                if not pagos_encontrados_debug.empty:
+                                    st.success(f"¡ENCONTRADO! Se encontraron {len(pagos_encontrados_debug)} pagos para el contrato '{primer_contrato_col}'.")
+                                    st.dataframe(pagos_encontrados_debug[["Contrato", "Deposito", "FechaTrans"]].head())
+                                else:
+                                    st.error(f"NO ENCONTRADO. Ningún pago para el contrato '{primer_contrato_col}' en Cobranzas.")
+                                    st.write(f"Primeros 20 valores únicos de 'Contrato' en Cobranzas para comparar: {df_cob_prom['Contrato'].astype(str).unique()[:20]}")
+                        else:
+                            st.warning("Columna 'Contrato' NO ENCONTRADA en df_cob_prom (Cobranzas).")
+                            st.write("Columnas disponibles en df_cob_prom:", df_cob_prom.columns.tolist())
                     else:
-                        st.warning("Columna 'Contrato' NO ENCONTRADA en df_cob_prom (Cobranzas).")
-                        st.write("Columnas disponibles en df_cob_prom:", df_cob_prom.columns.tolist())
-                else:
-                    st.write("df_cob_prom (Cobranzas) está vacío para este promotor.")
+                        st.write("df_cob_prom (Cobranzas) está vacío para este promotor.")
 
-                st.markdown("--- FIN DEBUG INFO ---")
+                    st.markdown("--- FIN DEBUG INFO ---")
 
                 # La siguiente línea original es:
                 # hoy = datetime.now().date()
 
-                # 3) Métricas por crédito
+                # 3) Métricas por crédito (vectorizadas: una fila por crédito, sin iterrows)
                 hoy = datetime.now().date()
-                filas = []
+                df_det = pd.DataFrame()
 
                 if df_col_prom.empty:
                     st.info("No hay créditos registrados para este promotor después del procesamiento.")
-                else:
-                    for _, cred in df_col_prom.iterrows():
-                        # Validar que las columnas necesarias para el cálculo existan en la fila 'cred'
-                        contrato = cred.get("Contrato", None)
-                        ps = cred.get("PS", 0)
-                        fecha_fp_obj = cred.get("FechaPrimerPago", None)
-
-                        if contrato is None or pd.isna(fecha_fp_obj):
-                            # Saltar este crédito si falta información esencial
-                            # Podrías añadir un st.warning aquí si quieres notificar sobre créditos omitidos
-                            continue
-                        
-                        fecha_fp = fecha_fp_obj.date()
-
-                        # Semanas transcurridas y pagos debidos
-                        weeks_elapsed = max(0, (hoy - fecha_fp).days // 7)
-                        pag_debidos = min(14, weeks_elapsed + 1) # Asumiendo máximo 14 pagos
-
-                        # Sumar todos los depósitos para este contrato
-                        total_dep = 0
-                        if not df_cob_prom.empty and "Contrato" in df_cob_prom.columns and "Deposito" in df_cob_prom.columns:
-                            pagos = df_cob_prom[df_cob_prom["Contrato"] == contrato]
-                            total_dep = pagos["Deposito"].sum()
-                        
-                        completos = 0
-                        resto = 0
-                        if ps > 0:
-                            completos = min(int(total_dep // ps), 14)
-                            resto = total_dep % ps
-                        
-                        incompletos = 1 if 0 < resto < ps else 0
-                        vencido_monto = max(0, pag_debidos * ps - total_dep)
-                        adelantados = max(0, completos - pag_debidos)
-
-                        # Estatus
-                        fecha_venc_credito = (fecha_fp + pd.Timedelta(weeks=13)) # Vencimiento del crédito (14 semanas)
-                        
-                        estatus = "Indeterminado"
-                        color = "grey"
-
-                        if completos >= 14 : # Crédito Liquidado
-                            estatus, color = "Liquidado", "blue"
-                        elif completos >= pag_debidos:
-                            estatus, color = "Al corriente", "green"
-                        elif hoy < fecha_venc_credito : # Aún no vence el crédito completo
-                            estatus, color = "Atrasado", "orange"
-                        else: # Ya pasó la fecha de vencimiento del crédito y no está liquidado
-                            estatus, color = "Vencido", "red"
-
-
-                        filas.append({
-                            "Cliente": cred.get("Cliente", "N/A"), # Usa .get() para seguridad
-                            "Contrato": contrato,
-                            "Pagos debidos": pag_debidos,
-                            "Pagos completos": completos,
-                            "Pagos incompletos": incompletos,
-                            "Saldo vencido": vencido_monto,
-                            "Pagos adelantados": adelantados,
-                            "Estatus": estatus,
-                            "Color": color,
-                        })
-                
-                df_det = pd.DataFrame(filas)
+                elif "Contrato" in df_col_prom.columns:
+                    # Sólo créditos con fecha de primer pago (sin ella no se pueden evaluar)
+                    creditos = df_col_prom[df_col_prom["FechaPrimerPago"].notna()]
+                    fecha_fp = creditos["FechaPrimerPago"].dt.normalize()
+                    hoy_ts = pd.Timestamp(hoy)
+
+                    # Semanas transcurridas y pagos debidos (máximo 14 pagos)
+                    weeks_elapsed = np.maximum(0, (hoy_ts - fecha_fp).dt.days.to_numpy() // 7)
+                    pag_debidos = np.minimum(14, weeks_elapsed + 1)
+
+                    # Total depositado por contrato: índice (N, Contrato) construido una vez por archivo
+                    if not df_cob_prom.empty and "Contrato" in df_cob_prom.columns:
+                        claves = pd.MultiIndex.from_arrays([
+                            np.full(len(creditos), promotor_sel, dtype=object),
+                            creditos["Contrato"].to_numpy(),
+                        ])
+                        total_dep = (
+                            deposits_by_contract(df_cobranza)
+                            .reindex(claves)
+                            .fillna(0)
+                            .to_numpy(dtype=np.float64)
+                        )
+                    else:
+                        total_dep = np.zeros(len(creditos))
+
+                    # Pagos completos y resto (sólo si hay cuota)
+                    ps = creditos["PS"].to_numpy(dtype=np.float64)
+                    con_cuota = ps > 0
+                    completos = np.zeros(len(creditos), dtype=np.int64)
+                    resto = np.zeros(len(creditos))
+                    completos[con_cuota] = np.minimum(total_dep[con_cuota] // ps[con_cuota], 14)
+                    resto[con_cuota] = total_dep[con_cuota] % ps[con_cuota]
+
+                    incompletos = ((resto > 0) & (resto < ps)).astype(np.int64)
+                    vencido_monto = np.maximum(0, pag_debidos * ps - total_dep)
+                    adelantados = np.maximum(0, completos - pag_debidos)
+
+                    # Estatus: liquidado, al corriente, atrasado (aún no vence el crédito
+                    # de 14 semanas) o vencido
+                    fecha_venc_credito = (fecha_fp + pd.Timedelta(weeks=13)).to_numpy()
+                    condiciones = [
+                        completos >= 14,
+                        completos >= pag_debidos,
+                        np.datetime64(hoy_ts) < fecha_venc_credito,
+                    ]
+                    estatus = np.select(condiciones, ["Liquidado", "Al corriente", "Atrasado"], default="Vencido")
+
+                    # DataFrame armado por columnas con tipos explícitos (conteos acotados a 0..14 → int8)
+                    df_det = pd.DataFrame({
+                        "Cliente": creditos["Cliente"].to_numpy() if "Cliente" in creditos.columns else "N/A",
+                        "Contrato": creditos["Contrato"].to_numpy(),
+                        "Pagos debidos": pag_debidos.astype(np.int8),
+                        "Pagos completos": completos,
+                        "Pagos incompletos": incompletos.astype(np.int8),
+                        "Saldo vencido": vencido_monto,
+                        "Pagos adelantados": adelantados.astype(np.int8),
+                        "Estatus": pd.Categorical(estatus),
+                    })
             if df_det.empty:
                 st.info("No hay créditos para mostrar para este promotor (posiblemente por falta de datos o errores en el procesamiento).")
             else:
-                # 4) Formato y estilo
-                df_det["Saldo vencido"] = df_det["Saldo vencido"].apply(format_money)
-
-                def pintar(row):
-                    # Esta función ASUME que la columna "Color" existe en la 'row' que recibe
-                    # de df_det_styled
-                    color_val = row.get("Color", "grey") # Usamos .get() por seguridad, por si acaso
-                    return [f"color: {color_val}; font-weight: bold;" if col == "Estatus" else "" for col in row.index]
-
-                # Aplicamos el estilo al DataFrame COMPLETO (que SÍ tiene la columna "Color")
-                df_det_styled = df_det.style.apply(pintar, axis=1)
-
-                # Columnas que queremos MOSTRAR al usuario final (excluyendo "Color")
-                columnas_a_mostrar = [col for col in df_det.columns if col != "Color"]
+                # 4) Formato y estilo (el monto sigue numérico; el formato es sólo de presentación)
+                # Sólo la columna "Estatus" pasa por el estilo; el color sale de COLOR_ESTATUS
+                df_det_styled = style_money(df_det, ["Saldo vencido"]).apply(style_estatus, subset=["Estatus"])
 
                 st.dataframe(
-                    df_det_styled, # Pasamos el DataFrame ya estilizado
+                    df_det_styled,
                     use_container_width=True,
                     height=min(600, 35 + 30 * len(df_det)), # Ajustar altura
-                    # Para ocultar la columna "Color" visualmente si aún estuviera después del styler:
-                    column_config={ 
-                        "Color": None # Esto oculta la columna "Color" si el styler no la eliminó
-                    },
-                    # O, si quieres ser más explícito sobre qué columnas mostrar del df_det original:
-                    # data=df_det[columnas_a_mostrar].style.apply(pintar, axis=1) 
-                    # Pero es más simple aplicar el estilo y luego ocultar/configurar.
-                    # La forma más limpia es que el styler no dependa de una columna que se va a quitar *justo antes*.
-
-                    # Vamos a probar solo ocultándola, ya que el styler puede necesitarla.
-                    # Si st.dataframe(df_det_styled...) muestra la columna "Color", entonces usamos
-                    # data=df_det[columnas_a_mostrar] y aplicamos el style a eso.
-                    # Pero primero, probemos si el styler la maneja bien y luego st.dataframe
-                    # puede simplemente mostrar el resultado.
-                    # El .drop() ANTES del .style.apply() es el problema directo.
                 )
 
 
@@ -2039,10 +2400,8 @@ def main():
             # ──────────────────────────────────────────────────────────────
             # 1) Penúltima y última semanas disponibles
             # ──────────────────────────────────────────────────────────────
-            semanas = sorted(
-                df_metas_summary["Semana"].unique(),
-                key=lambda p: p.start_time
-            )
+            # Semana es period[W-FRI]: el ordenamiento nativo evita la lambda por comparación
+            semanas = df_metas_summary["Semana"].drop_duplicates().sort_values().tolist()
             penult_week = semanas[-2] if len(semanas) >= 2 else None
             last_week   = semanas[-1] if len(semanas) >= 1 else None
 
@@ -2052,49 +2411,36 @@ def main():
             # ──────────────────────────────────────────────────────────────
             # 2) Tabla principal de metas vs. cobranza
             # ──────────────────────────────────────────────────────────────
-            code_to_name = dict(zip(df_control["N"], df_control["Nombre"]))
-            codes_sorted = sorted(df_control["N"], key=lambda x: int(x.lstrip("P")))  # P01, P02…
-
-            META_COL = "Promotor"   # columna en df_metas_summary
-
-            tot_rows = []
-            for code in codes_sorted:
-                nombre = code_to_name.get(code, "")
-
-                penult_val = df_metas_summary.query(
-                    f"{META_COL} == @code and Semana == @penult_week"
-                )["Meta"].sum()
-
-                last_val = df_metas_summary.query(
-                    f"{META_COL} == @code and Semana == @last_week"
-                )["Meta"].sum()
-
-                suma_metas = df_metas_summary.loc[
-                    df_metas_summary[META_COL] == code, "Meta"
-                ].sum()
-
-                suma_cob = (
-                    df_cobranza.loc[df_cobranza["N"] == code, "Depósito"].sum()
-                    if not df_cobranza.empty else 0
-                )
+            # Totales por promotor con groupbys sobre todo el DataFrame (sin bucle por código)
+            metas_por_prom = df_metas_summary.groupby("Promotor", observed=True)["Meta"].sum()
+            # Penúltima/última semana: columnas de la tabla promotor × semana (cacheada)
+            metas_semana = metas_by_promoter_week(df_metas_summary)
+            penult_por_prom = metas_semana.get(penult_week, pd.Series(dtype=np.float64))
+            last_por_prom = metas_semana.get(last_week, pd.Series(dtype=np.float64))
+            cob_por_prom = (
+                df_cobranza.groupby("N", observed=True)["Depósito"].sum()
+                if not df_cobranza.empty else pd.Series(dtype=np.float64)
+            )
 
-                tot_rows.append({
-                    "N": code,
-                    "Nombre": nombre,
-                    penult_header: penult_val,
-                    last_header:  last_val,
-                    "Suma Metas": suma_metas,
-                    "Cobranza Hasta Último Viernes": suma_cob
+            if codes_sorted:
+                codigos = pd.Series(codes_sorted)
+                df_totales = pd.DataFrame({
+                    "N": codigos,
+                    "Nombre": codigos.map(code_to_name).fillna(""),
+                    penult_header: codigos.map(penult_por_prom).fillna(0),
+                    last_header: codigos.map(last_por_prom).fillna(0),
+                    "Suma Metas": codigos.map(metas_por_prom).fillna(0),
+                    "Cobranza Hasta Último Viernes": codigos.map(cob_por_prom).fillna(0),
                 })
 
-            if tot_rows:
-                df_totales = pd.DataFrame(tot_rows)
-
-                # Formateo MXN
-                for col in [penult_header, last_header, "Suma Metas", "Cobranza Hasta Último Viernes"]:
-                    df_totales[col] = df_totales[col].apply(format_money)
-
-                st.dataframe(df_totales, use_container_width=True)
+                # Formateo MXN (sólo de presentación)
+                st.dataframe(
+                    style_money(
+                        df_totales,
+                        [penult_header, last_header, "Suma Metas", "Cobranza Hasta Último Viernes"]
+                    ),
+                    use_container_width=True
+                )
             else:
                 st.info("No hay datos para mostrar en esta sección.")
 